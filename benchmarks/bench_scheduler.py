@@ -0,0 +1,56 @@
+"""Hold-model benchmark of the pending-event schedulers.
+
+Fills a scheduler with ``n`` events, then times hold operations: pop the
+earliest event and push it back at ``time + increment``, so the queue size
+stays constant.  This is the classic measure for pending-event sets and
+shows how the cost per operation grows with the number of pending events.
+
+    python benchmarks/bench_scheduler.py --sizes 100 10000 1000000
+"""
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from scheduler import SCHEDULERS  # noqa: E402
+
+INCREMENTS = {
+    'exponential': lambda rng, n: rng.exponential(1.0, n),
+    'uniform': lambda rng, n: rng.uniform(0.0, 2.0, n),
+    'bimodal': lambda rng, n: np.where(rng.random(n) < 0.9, rng.uniform(0.0, 0.2, n), rng.uniform(9.0, 11.0, n)),
+}
+
+
+def hold(name, size, operations, increments, seed=0):
+    """Nanoseconds per hold operation for one scheduler at one queue size."""
+    rng = np.random.default_rng(seed)
+    steps = INCREMENTS[increments](rng, size + operations).tolist()
+    seq = itertools.count()
+    queue = SCHEDULERS[name]()
+    for t in steps[:size]:
+        queue.push((t, next(seq)))
+    push, pop = queue.push, queue.pop
+    started = time.perf_counter()
+    for step in steps[size:]:
+        t, _ = pop()
+        push((t + step, next(seq)))
+    return (time.perf_counter() - started) / operations * 1e9
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scheduler hold-operation cost as pending events grow")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--operations", type=int, default=200000)
+    parser.add_argument("--increments", choices=sorted(INCREMENTS), default="exponential")
+    args = parser.parse_args()
+
+    names = sorted(SCHEDULERS)
+    print(f"{'pending':>10}  " + "  ".join(f"{name + ' ns/op':>16}" for name in names))
+    for size in args.sizes:
+        costs = [hold(name, size, args.operations, args.increments) for name in names]
+        print(f"{size:>10}  " + "  ".join(f"{cost:>16.0f}" for cost in costs))
@@ -0,0 +1,169 @@
+"""In-process order throughput benchmark of the demo order and inventory services.
+
+Both FastAPI apps are imported from ``--app`` and driven through httpx's
+ASGI transport under one event loop, so no ports, containers or
+uvicorn workers are involved.  Each run uses a fresh SQLite file.
+Redis is a fakeredis TCP server started for the run, unless
+``--redis-url`` points at a real one.  A fresh process per run keeps the
+module-level engines, caches and queues from leaking between runs.
+
+One product is created with enough stock for every order.  Then
+``--orders`` orders are POSTed, ``--concurrency`` at a time, and every
+order is polled until inventory has decided it.  The report gives POST
+throughput, POST latency, errors, and how long it took until every order
+was confirmed or rejected.  Services with a product cache also report
+its counters from ``GET /cache/stats``.
+
+``--app`` may point at an older checkout, e.g. a ``git worktree``, so
+that two commits are measured with the same harness:
+
+    python benchmarks/bench_services.py --orders 1000 --concurrency 50
+    git worktree add /tmp/before <commit>
+    python benchmarks/bench_services.py --app /tmp/before/dst/demo_app
+
+It needs dst/demo_app/requirements.txt plus httpx and fakeredis.
+Numbers only compare on the same machine.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from histogram import LatencyHistogram  # noqa: E402
+
+DECIDED = ("confirmed", "rejected", "failed")
+
+
+def start_fake_redis():
+    """A fakeredis server on a free local port; returns its URL"""
+    from fakeredis import TcpFakeServer
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}"
+
+
+def load_services(app_dir):
+    """Import both services from ``app_dir``; environment must already be set"""
+    sys.path.insert(0, str(Path(app_dir).resolve()))
+    return importlib.import_module("inventory_service"), importlib.import_module("order_service")
+
+
+async def run(services, orders, concurrency, decide_timeout):
+    import httpx
+
+    inventory, order = services
+    for service in services:
+        await service.app.router.startup()
+    clients = [httpx.AsyncClient(transport=httpx.ASGITransport(app=service.app), base_url="http://bench",
+                                 timeout=60.0)
+               for service in services]
+    inventory_client, order_client = clients
+    report = {"orders": orders, "concurrency": concurrency}
+    try:
+        resp = await inventory_client.post("/products", json={
+            "name": "Bench item", "price": 1.0, "stock_quantity": orders})
+        resp.raise_for_status()
+        product_id = resp.json()["id"]
+
+        latency = LatencyHistogram()
+        order_ids = []
+        errors = 0
+        limit = asyncio.Semaphore(concurrency)
+
+        async def place(i):
+            nonlocal errors
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    resp = await order_client.post("/orders", json={
+                        "customer_id": f"bench_{i}", "product_id": product_id, "quantity": 1})
+                    resp.raise_for_status()
+                    order_ids.append(resp.json()["id"])
+                except Exception:
+                    errors += 1
+                latency.record(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[place(i) for i in range(orders)])
+        posted = time.perf_counter() - started
+
+        # Every placed order, until it is decided or the wait runs out
+        statuses = {}
+        undecided = list(order_ids)
+        deadline = time.perf_counter() + decide_timeout
+        while undecided and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            still = []
+            for order_id in undecided:
+                status = (await order_client.get(f"/orders/{order_id}")).json()["status"]
+                if status in DECIDED:
+                    statuses[status] = statuses.get(status, 0) + 1
+                else:
+                    still.append(order_id)
+            undecided = still
+        report.update({
+            "post_seconds": posted,
+            "orders_per_second": orders / posted,
+            "errors": errors,
+            "decided": sum(statuses.values()),
+            "statuses": statuses,
+            "seconds_to_decided": time.perf_counter() - started if not undecided else None,
+            "latency": latency.summary(),
+            "cache": {},
+        })
+        for name, client in (("inventory", inventory_client), ("order", order_client)):
+            resp = await client.get("/cache/stats")
+            if resp.status_code == 200:
+                report["cache"][name] = resp.json()
+    finally:
+        for client in clients:
+            await client.aclose()
+        for service in services:
+            await service.app.router.shutdown()
+    return report
+
+
+def print_report(report):
+    latency = report["latency"]
+    decided = report["seconds_to_decided"]
+    print(f"{report['orders']} orders at concurrency {report['concurrency']}: "
+          f"{report['orders_per_second']:.1f} orders/s, {report['errors']} failed POSTs")
+    print(f"POST latency p50/p99/max: {latency['p50'] * 1000:.1f} / {latency['p99'] * 1000:.1f} / "
+          f"{latency['max'] * 1000:.1f} ms")
+    print(f"Decided: {report['decided']} {report['statuses']}, "
+          + (f"all within {decided:.2f} s" if decided is not None else "some never were"))
+    for name, stats in report["cache"].items():
+        print(f"{name} product cache: {stats['loads']} loads, {stats['hits']} hits, "
+              f"{stats['misses']} misses, {stats['invalidations']} invalidations")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process order throughput of the demo services")
+    parser.add_argument("--app", default=str(ROOT / "dst" / "demo_app"), help="demo_app directory to import")
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--redis-url", help="use this Redis instead of a fakeredis server")
+    parser.add_argument("--decide-timeout", type=float, default=60.0,
+                        help="seconds to wait for every order to be decided")
+    args = parser.parse_args()
+
+    os.environ["REDIS_URL"] = args.redis_url or start_fake_redis()
+    os.environ["DB_PATH"] = str(Path(tempfile.mkdtemp()) / "bench.db")
+    report = asyncio.run(run(load_services(args.app), args.orders, args.concurrency, args.decide_timeout))
+    print_report(report)
+    sys.stdout.flush()
+    # Older message queues listen on non-daemon threads that never return
+    os._exit(0)
@@ -0,0 +1,242 @@
+"""Reproducible end-to-end benchmarks of the simulator with regression tracking.
+
+Runs a fixed set of TrafficGenerator scenarios, each in a fresh
+subprocess so that peak RSS belongs to that scenario alone and runs
+cannot warm each other's caches.  Every scenario is seeded, so a given
+commit always processes the same events.  The only thing that changes
+between runs is how fast it gets through them.
+
+Each run is appended to a JSON history along with the commit and a hash
+of the simulator sources.  If a baseline exists, the run is compared to
+it: a scenario regresses when its events/sec drops, or its peak RSS
+grows, by more than ``--threshold``.  The script then exits with status 1.
+
+    python benchmarks/bench_sim.py                      # run and compare
+    python benchmarks/bench_sim.py --update-baseline    # accept this run
+    python benchmarks/bench_sim.py --scenarios large_pool --repeat 5
+
+Numbers only compare on the same machine.  The history and baseline files
+are therefore kept out of git.
+"""
+import argparse
+import atexit
+import datetime
+import json
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from distributions import Exponential, Pareto  # noqa: E402
+from main import TrafficGenerator  # noqa: E402
+from sweep import code_version  # noqa: E402
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "history.json"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def small_light(scale):
+    # A handful of servers at ~17% utilisation: the per-event overhead floor
+    sim = TrafficGenerator(5.0, Exponential(1.0), num_servers=3, capacity=10, seed=1)
+    return sim, 20000 * scale
+
+
+def large_pool(scale):
+    # 5,000 servers and ~20k requests in flight: selection and pool indexes at scale
+    sim = TrafficGenerator(20000.0, Exponential(1.0), num_servers=5000, capacity=10,
+                           algorithm="least_connections", seed=2)
+    return sim, 10 * scale
+
+
+def saturated(scale):
+    # Offered load 1.5x capacity: backlogs, timeouts, retries and drops
+    sim = TrafficGenerator(150.0, Exponential(1.0), num_servers=10, capacity=10, seed=3,
+                           max_queue=20, queue_timeout=5.0, max_tries=2)
+    return sim, 1000 * scale
+
+
+def long_tail(scale):
+    # Pareto service times (alpha 1.5, mean 1 s): a few very long requests
+    sim = TrafficGenerator(250.0, Pareto(1.5, 1 / 3), num_servers=50, capacity=10,
+                           algorithm="least_connections", seed=4, max_queue=10)
+    return sim, 600 * scale
+
+
+def trace_replay(scale):
+    # A synthetic 300k-line access log replayed along its recorded upstreams.
+    # Writing and ingesting the log is setup and not part of the timed run.
+    from access_log import Trace, replay
+
+    rng = np.random.default_rng(5)
+    count = int(300000 * scale)
+    finish = 1.7e9 + np.cumsum(rng.exponential(1 / 1000, count))
+    request_times = rng.lognormal(-3.0, 1.0, count)
+    upstreams = rng.integers(0, 20, count)
+    directory = tempfile.mkdtemp(prefix="bench_trace_")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    log = Path(directory) / "access.log"
+    with open(log, "w") as f:
+        for t, rt, up in zip(finish.tolist(), request_times.tolist(), upstreams.tolist()):
+            f.write(f'10.0.0.1 [{t:.3f}] "GET / HTTP/1.1" 200 rt={rt:.3f} ua="10.1.0.{up}:80"\n')
+    trace = Trace(str(log), window=60.0)
+    sim = replay(trace, follow_upstream=True, capacity=100, max_queue=100)
+    return sim, trace.duration + 60.0
+
+
+SCENARIOS = {
+    'small_light': small_light,
+    'large_pool': large_pool,
+    'saturated': saturated,
+    'long_tail': long_tail,
+    'trace_replay': trace_replay,
+}
+
+
+def run_scenario(name, scale=1.0):
+    """Build and run one scenario in this process; returns its measurements."""
+    setup_started = time.perf_counter()
+    sim, duration = SCENARIOS[name](scale)
+    setup = time.perf_counter() - setup_started
+    sim.run_simulation(duration)
+    return {
+        'events': sim.events_processed,
+        'events_per_second': sim.events_per_second,
+        'wall_time': sim.wall_time,
+        'setup_time': setup,
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+                       (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'total_requests': sim.stats['total_requests'],
+        'dropped_requests': sim.stats['dropped_requests'],
+    }
+
+
+def measure(name, repeat=3, scale=1.0):
+    """Median of ``repeat`` runs, each in a fresh interpreter."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, __file__, "--child", name, "--scale", str(scale)],
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out))
+    result = dict(runs[0])
+    for key in ('events_per_second', 'wall_time', 'setup_time', 'peak_rss_mb'):
+        result[key] = statistics.median(run[key] for run in runs)
+    result['runs'] = repeat
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Scenarios whose throughput fell or memory grew by more than ``threshold``."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        if result['events'] != base['events']:
+            # Different work, e.g. a behaviour change: speed is not comparable
+            continue
+        if result['events_per_second'] < base['events_per_second'] * (1 - threshold):
+            regressions.append((name, 'events/sec', base['events_per_second'], result['events_per_second']))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+            regressions.append((name, 'peak RSS MB', base['peak_rss_mb'], result['peak_rss_mb']))
+    return regressions
+
+
+def format_table(results, baseline=None):
+    base = (baseline or {}).get('results', {})
+    lines = [f"{'scenario':<14}{'events':>11}{'events/sec':>13}{'vs base':>9}{'wall s':>9}{'RSS MB':>9}"]
+    for name, result in results.items():
+        change = ''
+        if name in base and result['events'] == base[name]['events']:
+            change = f"{result['events_per_second'] / base[name]['events_per_second'] - 1:+.1%}"
+        elif name in base:
+            change = 'n/a'
+        lines.append(f"{name:<14}{result['events']:>11,}{result['events_per_second']:>13,.0f}{change:>9}"
+                     f"{result['wall_time']:>9.2f}{result['peak_rss_mb']:>9.1f}")
+    return "\n".join(lines)
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path, data):
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    tmp.replace(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator and flag performance regressions")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the median is kept")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every scenario's length; only same-scale runs compare")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown or memory growth counted as a regression")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.scale)))
+        sys.exit(0)
+
+    run = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'code_version': code_version(),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'scale': args.scale,
+        'results': {},
+    }
+    for name in args.scenarios:
+        run['results'][name] = measure(name, args.repeat, args.scale)
+        print(f"{name}: {run['results'][name]['events_per_second']:,.0f} events/sec", file=sys.stderr)
+
+    history = load_json(args.history, [])
+    history.append(run)
+    write_json(args.history, history)
+
+    baseline = load_json(args.baseline, None)
+    if baseline is not None and baseline.get('scale') != args.scale:
+        print(f"Baseline was recorded at scale {baseline.get('scale')}, not comparing")
+        baseline = None
+    print(format_table(run['results'], baseline))
+
+    regressions = compare(run['results'], baseline, args.threshold) if baseline else []
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name}: {metric} {before:,.1f} -> {after:,.1f} ({after / before - 1:+.1%})")
+
+    if args.update_baseline:
+        write_json(args.baseline, run)
+        print(f"Baseline updated ({run['commit'] or run['code_version']})")
+    elif baseline is not None:
+        print(f"Compared against baseline from {baseline['timestamp']} ({baseline['commit'] or baseline['code_version']})")
+    sys.exit(1 if regressions and not args.update_baseline else 0)
@@ -1,12 +1,17 @@
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from shared.models import get_db, Product
+from typing import List
+from shared.models import get_db, SessionLocal, Product
 from shared.message_queue import MessageQueue
-import asyncio
+from shared.reservations import ReservationEngine
+from shared.cache import ProductCache, load_product
 
 app = FastAPI(title="Inventory Service")
-mq = MessageQueue()
+mq = MessageQueue(group="inventory-service")
+products = ProductCache()
+reservations = ReservationEngine(SessionLocal, mq, cache=products)
 
 class ProductCreate(BaseModel):
     name: str
@@ -22,17 +27,28 @@ class ProductResponse(BaseModel):
 @app.on_event("startup")
 async def startup():
     print("Inventory service starting up...")
-    # Subscribe to order events
-    await mq.subscribe("order_received", handle_order_received)
+    await mq.connect()
+    # Order events are reserved in batches by the reservation engine
+    reservations.start()
+    await mq.subscribe("order_received", reservations.submit)
+    # Updates made by other inventory instances, and their reservation batches
+    await mq.subscribe_broadcast("product_updated", products.handle_product_updated)
+    await mq.subscribe_broadcast("stock_updated", products.handle_product_updated)
     print("Inventory service startup complete!")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await reservations.stop()
+    await mq.close()
+
 @app.post("/products", response_model=ProductResponse)
-async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_db)):
     """Create a new product"""
     db_product = Product(**product.dict())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    # Caches never hold misses, so a new id needs no product_updated event
     
     return ProductResponse(
         id=db_product.id,
@@ -41,66 +57,59 @@ async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
         stock_quantity=db_product.stock_quantity
     )
 
+@app.post("/products/batch", response_model=List[ProductResponse])
+async def create_products(products_in: List[ProductCreate], db: AsyncSession = Depends(get_db)):
+    """Create many products with one insert; results are in request order"""
+    if not products_in:
+        return []
+    result = await db.scalars(
+        insert(Product).returning(Product, sort_by_parameter_order=True),
+        [product.dict() for product in products_in]
+    )
+    created = result.all()
+    await db.commit()
+    # New ids, so no product_updated events, as in create_product
+    return [
+        ProductResponse(
+            id=product.id,
+            name=product.name,
+            price=product.price,
+            stock_quantity=product.stock_quantity
+        )
+        for product in created
+    ]
+
 @app.get("/products/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
+async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
     """Get product details"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await products.get_or_load(product_id, load_product)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return ProductResponse(
-        id=product.id,
-        name=product.name,
-        price=product.price,
-        stock_quantity=product.stock_quantity
-    )
+    return ProductResponse(**product)
 
 @app.put("/products/{product_id}/stock")
-async def update_stock(product_id: int, quantity: int, db: Session = Depends(get_db)):
+async def update_stock(product_id: int, quantity: int, db: AsyncSession = Depends(get_db)):
     """Update product stock (for testing setup)"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    result = await db.execute(
+        update(Product).where(Product.id == product_id).values(stock_quantity=quantity).returning(Product.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    product.stock_quantity = quantity
-    db.commit()
+    await db.commit()
+    await product_updated(product_id)
     
     return {"message": f"Stock updated to {quantity}"}
 
-async def handle_order_received(message: dict, db: Session = Depends(get_db)):
-    """Handle incoming order events and check inventory"""
-    order_id = message.get("order_id")
-    product_id = message.get("product_id")
-    quantity = message.get("quantity")
-    
-    print(f"Processing inventory check for order {order_id}")
-    
-    # Check and reserve inventory
-    
-    try:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        
-        if product and product.stock_quantity >= quantity:
-            # Reserve inventory (decrement stock)
-            product.stock_quantity -= quantity
-            db.commit()
-            available = True
-            print(f"Reserved {quantity} units of product {product_id}")
-        else:
-            available = False
-            print(f"Insufficient stock for product {product_id}")
-        
-        # Publish inventory check result
-        await mq.publish("inventory_checked", {
-            "order_id": order_id,
-            "product_id": product_id,
-            "quantity": quantity,
-            "available": available,
-            "remaining_stock": product.stock_quantity if product else 0
-        })
-        
-    finally:
-        db.close()
+@app.get("/cache/stats")
+async def cache_stats():
+    """Product cache hit/miss counters"""
+    return products.stats()
+
+async def product_updated(product_id: int):
+    """Drop the product from this cache now and tell other services"""
+    products.invalidate(product_id)
+    await mq.broadcast("product_updated", {"product_id": product_id})
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,12 +1,15 @@
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from shared.models import get_db, Order, Product
+from typing import List, Optional
+from shared.models import get_db, SessionLocal, Order
 from shared.message_queue import MessageQueue
-import asyncio
+from shared.cache import ProductCache, load_product, load_products
 
 app = FastAPI(title="Order Service")
-mq = MessageQueue()
+mq = MessageQueue(group="order-service")
+products = ProductCache()
 
 class OrderRequest(BaseModel):
     customer_id: str
@@ -22,24 +25,34 @@ class OrderResponse(BaseModel):
     total_amount: float
     created_at: str
 
+class OrderBatchResult(BaseModel):
+    order: Optional[OrderResponse] = None
+    error: Optional[str] = None
+
 @app.on_event("startup")
 async def startup():
     print("Order service starting up...")
+    await mq.connect()
     # Subscribe to inventory responses
     await mq.subscribe("inventory_checked", handle_inventory_response)
+    await mq.subscribe_broadcast("product_updated", products.handle_product_updated)
     print("Order service startup complete!")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await mq.close()
+
 @app.post("/orders", response_model=OrderResponse)
-async def create_order(order_req: OrderRequest, db: Session = Depends(get_db)):
+async def create_order(order_req: OrderRequest, db: AsyncSession = Depends(get_db)):
     """Create a new order and trigger inventory check"""
     
     # Validate product exists
-    product = db.query(Product).filter(Product.id == order_req.product_id).first()
+    product = await products.get_or_load(order_req.product_id, load_product)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Calculate total
-    total_amount = product.price * order_req.quantity
+    total_amount = product["price"] * order_req.quantity
     
     # Create order in pending state
     order = Order(
@@ -51,8 +64,8 @@ async def create_order(order_req: OrderRequest, db: Session = Depends(get_db)):
     )
     
     db.add(order)
-    db.commit()
-    db.refresh(order)
+    await db.commit()
+    await db.refresh(order)
     
     # Publish order created event
     await mq.publish("order_received", {
@@ -72,10 +85,57 @@ async def create_order(order_req: OrderRequest, db: Session = Depends(get_db)):
         created_at=order.created_at.isoformat()
     )
 
+@app.post("/orders/batch", response_model=List[OrderBatchResult])
+async def create_orders(order_reqs: List[OrderRequest], db: AsyncSession = Depends(get_db)):
+    """Create many orders with one insert and one publish; results are in request order"""
+    catalog = await products.get_or_load_many([o.product_id for o in order_reqs], load_products)
+    rows = [
+        {
+            "customer_id": o.customer_id,
+            "product_id": o.product_id,
+            "quantity": o.quantity,
+            "total_amount": catalog[o.product_id]["price"] * o.quantity,
+            "status": "pending"
+        }
+        for o in order_reqs if o.product_id in catalog
+    ]
+    orders = []
+    if rows:
+        result = await db.scalars(insert(Order).returning(Order, sort_by_parameter_order=True), rows)
+        orders = result.all()
+        await db.commit()
+        await mq.publish_many("order_received", [
+            {
+                "order_id": order.id,
+                "product_id": order.product_id,
+                "quantity": order.quantity,
+                "customer_id": order.customer_id
+            }
+            for order in orders
+        ])
+    
+    created = iter(orders)
+    results = []
+    for o in order_reqs:
+        if o.product_id not in catalog:
+            results.append(OrderBatchResult(error="Product not found"))
+            continue
+        order = next(created)
+        results.append(OrderBatchResult(order=OrderResponse(
+            id=order.id,
+            customer_id=order.customer_id,
+            product_id=order.product_id,
+            quantity=order.quantity,
+            status=order.status,
+            total_amount=order.total_amount,
+            created_at=order.created_at.isoformat()
+        )))
+    return results
+
 @app.get("/orders/{order_id}")
-async def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
     """Get order status"""
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -89,20 +149,33 @@ async def get_order(order_id: int, db: Session = Depends(get_db)):
         created_at=order.created_at.isoformat()
     )
 
-async def handle_inventory_response(message: dict, db: Session = Depends(get_db)):
+@app.get("/cache/stats")
+async def cache_stats():
+    """Product cache hit/miss counters"""
+    return products.stats()
+
+async def handle_inventory_response(message: dict):
     """Handle inventory check responses"""
     order_id = message.get("order_id")
     available = message.get("available", False)
     
-    # Update order status based on inventory check
-    try:
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if order:
-            order.status = "confirmed" if available else "rejected"
-            db.commit()
-            print(f"Order {order_id} status updated to: {order.status}")
-    finally:
-        db.close()
+    # Message handlers are not FastAPI endpoints, so Depends() never runs
+    # here; they open their own session
+    async with SessionLocal() as db:
+        # Update order status based on inventory check, as a single write.
+        # A retryable error is a fault on the inventory side, not a refusal
+        if available:
+            status = "confirmed"
+        elif message.get("retryable"):
+            status = "failed"
+        else:
+            status = "rejected"
+        result = await db.execute(
+            update(Order).where(Order.id == order_id).values(status=status).returning(Order.id)
+        )
+        if result.scalar_one_or_none() is not None:
+            await db.commit()
+            print(f"Order {order_id} status updated to: {status}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from sqlalchemy import select
+from shared.models import SessionLocal, Product
+import asyncio
+import time
+import os
+
+class ProductCache:
+    """In-process LRU cache of product rows with a time-to-live.
+
+    Holds at most `maxsize` products as plain dicts (never ORM objects,
+    which belong to a session), each for at most `ttl` seconds.  Services
+    drop entries when a `product_updated` event arrives, and inventory
+    replicas also on `stock_updated`; the TTL bounds staleness if an
+    event is missed.
+
+    `get_or_load` reads each missing product once, however many requests
+    miss on it at the same time.  It also guards against a load racing an
+    invalidation: if the product is invalidated while its row is being
+    read, the value read is returned to the callers but not cached.
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        if maxsize is None:
+            maxsize = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+        if ttl is None:
+            ttl = float(os.getenv("PRODUCT_CACHE_TTL", "30"))
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = {}
+        self._epoch = 0
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, product_id: int):
+        entry = self._entries.get(product_id)
+        if entry is not None:
+            value, expires = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return value
+            del self._entries[product_id]
+        self.misses += 1
+        return None
+
+    def put(self, product_id: int, value: dict):
+        self._entries[product_id] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(product_id)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, product_id: int, loader):
+        """Cached product, or `await loader(product_id)`; None if there is no such product"""
+        value = self.get(product_id)
+        if value is not None:
+            return value
+        loading = self._loading.get(product_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = asyncio.ensure_future(self._load(product_id, loader))
+        self._loading[product_id] = loading
+        return await asyncio.shield(loading)
+
+    async def get_or_load_many(self, product_ids, loader):
+        """Products for `product_ids` as {id: product}, missing ones left out.
+
+        Every product not cached is read with one `await loader(ids)`,
+        which returns {id: product} for those that exist.
+        """
+        found = {}
+        missing = []
+        for product_id in dict.fromkeys(product_ids):
+            value = self.get(product_id)
+            if value is None:
+                missing.append(product_id)
+            else:
+                found[product_id] = value
+        if missing:
+            self.loads += 1
+            tokens = {product_id: self._token(product_id) for product_id in missing}
+            loaded = await loader(missing)
+            for product_id, value in loaded.items():
+                if self._token(product_id) == tokens[product_id]:
+                    self.put(product_id, value)
+            found.update(loaded)
+        return found
+
+    async def _load(self, product_id, loader):
+        self.loads += 1
+        token = self._token(product_id)
+        try:
+            value = await loader(product_id)
+        finally:
+            self._loading.pop(product_id, None)
+        if value is not None and self._token(product_id) == token:
+            self.put(product_id, value)
+        return value
+
+    def invalidate(self, product_id: int = None):
+        """Drop one product, or everything if `product_id` is None"""
+        self.invalidations += 1
+        if product_id is None:
+            self._entries.clear()
+            self._generation.clear()
+            self._epoch += 1
+            return
+        self._entries.pop(product_id, None)
+        self._generation[product_id] = self._generation.get(product_id, 0) + 1
+
+    def _token(self, product_id):
+        return self._epoch, self._generation.get(product_id, 0)
+
+    async def handle_product_updated(self, message: dict):
+        """MessageQueue handler for `product_updated` events"""
+        self.invalidate(message.get("product_id"))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+def product_snapshot(product):
+    """The cached form of a Product row"""
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "stock_quantity": product.stock_quantity
+    }
+
+async def load_product(product_id: int):
+    """Read one product for the cache; None if it does not exist.
+
+    Uses its own short session.  Reading through the request's session
+    would open a read transaction there, and SQLite in WAL mode fails (rather
+    than waits) when such a transaction later tries to write after another
+    writer has committed.
+    """
+    async with SessionLocal() as db:
+        product = await db.get(Product, product_id)
+        return product_snapshot(product) if product else None
+
+async def load_products(product_ids):
+    """Read several products for the cache in one query, as {id: product}"""
+    async with SessionLocal() as db:
+        rows = await db.scalars(select(Product).where(Product.id.in_(product_ids)))
+        return {product.id: product_snapshot(product) for product in rows}
@@ -1,76 +1,427 @@
-import redis
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
 import json
 import asyncio
-from typing import Dict, Any, Callable
+from functools import partial
+from typing import Dict, Any, Callable, List
 import uuid
 import os
+import socket
 from datetime import datetime
-import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_dumps(message):
+    return json.dumps(message).encode()
+
+SERIALIZERS = {"json": (_json_dumps, json.loads)}
+if orjson is not None:
+    SERIALIZERS["orjson"] = (orjson.dumps, orjson.loads)
+
+MODES = ("pubsub", "streams")
 
 class MessageQueue:
-    def __init__(self, redis_url: str = None):
-        if redis_url is None:
-            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        
-        print(f"Connecting to Redis at: {redis_url}")
-        self.redis = redis.from_url(redis_url, decode_responses=True)
+    """Redis messaging on the service's own event loop.
+
+    Publishes are micro-batched: every publish made while a batch is
+    being collected (up to `batch_size` messages, or `batch_delay`
+    seconds) goes to Redis in one pipeline, and each caller's publish
+    returns once its batch is written.  Subscribed messages are read by a
+    single task that hands each message to its handler as a new task.
+
+    `mode` (MQ_MODE) chooses how `publish`/`subscribe` deliver:
+
+    - "pubsub": every subscriber gets every message, and messages sent
+      while nobody is subscribed are lost.
+    - "streams": each channel is a Redis stream.  Subscribers join the
+      consumer group `group` (MQ_GROUP), so replicas of a service split the
+      messages between them.  A message is acknowledged (XACK, batched)
+      once its handler returns.  Messages published while a service is
+      down wait in the stream for it, and a new group starts from the
+      beginning of the stream, so nothing sent before the first consumer
+      joined is lost.  Entries left unacknowledged for `reclaim_idle_ms`,
+      because their handler failed or their consumer died, are claimed
+      with XAUTOCLAIM and run again.  An entry Redis has delivered more
+      than `max_deliveries` times is moved to the "<channel>:dead" stream
+      instead.  Redis keeps that count, so it holds across restarts and
+      consumers.  Delivery is at-least-once, so handlers may see a message
+      twice after a crash.
+
+    `broadcast`/`subscribe_broadcast` always use pub/sub, for events every
+    replica must see, such as cache invalidations.
+
+    `serializer` is "json" or "orjson"; the default comes from
+    MQ_SERIALIZER and is orjson when it is installed.  Both produce plain
+    JSON, so services using different serializers can talk to each other.
+    `client` replaces the connection made from `redis_url`, for example
+    with a fakeredis client in tests.
+    """
+
+    def __init__(self, redis_url: str = None, serializer: str = None,
+                 batch_size: int = 256, batch_delay: float = 0.0,
+                 mode: str = None, group: str = None, consumer: str = None, client=None,
+                 block_ms: int = 1000, reclaim_idle_ms: int = 30000,
+                 stream_maxlen: int = 100000, max_deliveries: int = 5):
+        if serializer is None:
+            serializer = os.getenv("MQ_SERIALIZER", "orjson" if orjson is not None else "json")
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"unknown serializer {serializer!r}, expected one of {sorted(SERIALIZERS)}")
+        if mode is None:
+            mode = os.getenv("MQ_MODE", "pubsub")
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+
+        if client is None:
+            if redis_url is None:
+                redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+            print(f"Connecting to Redis at: {redis_url}")
+            client = redis.from_url(redis_url)
+        self.redis = client
+        self.dumps, self.loads = SERIALIZERS[serializer]
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.mode = mode
+        self.group = group or os.getenv("MQ_GROUP")
+        self.consumer = consumer or os.getenv("MQ_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+        self.block_ms = block_ms
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.stream_maxlen = stream_maxlen
+        self.max_deliveries = max_deliveries
         self.subscribers = {}
-        
-        # Test connection
+        self._pubsub = None
+        self._reader = None
+        self._pending = []
+        self._batch_done = None
+        self._flusher = None
+        self._tasks = set()
+        # Streams mode
+        self.stream_handlers = {}
+        self._cursors = {}
+        self._stream_reader = None
+        self._acks = []
+        # (stream, entry_id) of the entries being handled
+        self._in_flight = set()
+
+    async def connect(self):
+        """Check the connection; call once at service startup"""
         try:
-            self.redis.ping()
+            await self.redis.ping()
             print("Redis connection successful!")
         except Exception as e:
             print(f"Redis connection failed: {e}")
             raise
-    
-    async def publish(self, channel: str, message: Dict[Any, Any]):
-        """Publish a message to a channel"""
+
+    def _envelope(self, message: Dict[Any, Any]):
         message_id = str(uuid.uuid4())
-        message_with_id = {
+        return message_id, self.dumps({
             "id": message_id,
             "timestamp": datetime.utcnow().isoformat(),
             **message
-        }
-        # Use asyncio to run the blocking redis call in a thread
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.redis.publish, channel, json.dumps(message_with_id))
-        print(f"Published to {channel}: {message_with_id}")
+        })
+
+    async def publish(self, channel: str, message: Dict[Any, Any]):
+        """Publish a message to a channel"""
+        message_id, payload = self._envelope(message)
+        await self._enqueue([(channel, payload, self.mode == "streams")])
         return message_id
-    
+
+    async def publish_many(self, channel: str, messages: List[Dict[Any, Any]]):
+        """Publish several messages to a channel in one batch; returns their ids"""
+        return await self._publish_many(channel, messages, self.mode == "streams")
+
+    async def broadcast(self, channel: str, message: Dict[Any, Any]):
+        """Publish a message every `subscribe_broadcast` subscriber receives"""
+        message_id, payload = self._envelope(message)
+        await self._enqueue([(channel, payload, False)])
+        return message_id
+
+    async def broadcast_many(self, channel: str, messages: List[Dict[Any, Any]]):
+        """Broadcast several messages in one batch; returns their ids"""
+        return await self._publish_many(channel, messages, False)
+
+    async def _publish_many(self, channel, messages, stream):
+        ids = []
+        items = []
+        for message in messages:
+            message_id, payload = self._envelope(message)
+            ids.append(message_id)
+            items.append((channel, payload, stream))
+        if items:
+            await self._enqueue(items)
+        return ids
+
+    async def _enqueue(self, items):
+        self._pending.extend(items)
+        if self._batch_done is None:
+            self._batch_done = asyncio.get_running_loop().create_future()
+            self._flusher = asyncio.create_task(self._flush())
+        done = self._batch_done
+        if len(self._pending) >= self.batch_size:
+            # Full batch: stop collecting and write it now
+            self._batch_done = None
+            self._flusher.cancel()
+            self._flusher = None
+            # Shielded: the batch carries other publishers' messages too, so
+            # cancelling this one must not cancel the write or their future
+            await asyncio.shield(self._write(self._take(), done))
+        await asyncio.shield(done)
+
+    async def _flush(self):
+        """Write the collecting batch after `batch_delay`"""
+        await asyncio.sleep(self.batch_delay)
+        done = self._batch_done
+        self._batch_done = None
+        self._flusher = None
+        await self._write(self._take(), done)
+
+    def _take(self):
+        batch = self._pending
+        self._pending = []
+        return batch
+
+    async def _write(self, batch, done):
+        """Pipeline `batch` to Redis; the outcome goes to every waiter via `done`"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for channel, payload, stream in batch:
+                    if stream:
+                        pipe.xadd(channel, {"data": payload}, maxlen=self.stream_maxlen, approximate=True)
+                    else:
+                        pipe.publish(channel, payload)
+                await pipe.execute()
+        except Exception as e:
+            if not done.done():
+                done.set_exception(e)
+        else:
+            if not done.done():
+                done.set_result(len(batch))
+
     async def subscribe(self, channel: str, handler: Callable):
         """Subscribe to a channel with a message handler"""
+        if self.mode == "streams":
+            await self._subscribe_stream(channel, handler)
+        else:
+            await self.subscribe_broadcast(channel, handler)
+
+    async def subscribe_broadcast(self, channel: str, handler: Callable):
+        """Receive every message sent to a channel with `broadcast`"""
         try:
             print(f"Setting up subscription to {channel}")
-            
-            # Start the listener in a separate thread to avoid blocking
-            loop = asyncio.get_event_loop()
-            thread = threading.Thread(
-                target=self._start_listener_thread,
-                args=(channel, handler, loop),
-                daemon=True
-            )
-            thread.start()
-            
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(channel)
+            self.subscribers[channel.encode()] = handler
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
             print(f"Subscribed to {channel}")
         except Exception as e:
             print(f"Error subscribing to {channel}: {e}")
             raise
-    
-    def _start_listener_thread(self, channel: str, handler: Callable, loop):
-        """Start Redis listener in a separate thread"""
+
+    async def _read(self):
+        """Single reader for every subscribed channel"""
+        pubsub = self._pubsub
+        while True:
+            try:
+                message = await pubsub.get_message(timeout=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in message reader: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            channel = message["channel"]
+            try:
+                data = self.loads(message["data"])
+            except Exception as e:
+                print(f"Error decoding message in {channel.decode()}: {e}")
+                continue
+            task = asyncio.create_task(self.subscribers[channel](data))
+            self._tasks.add(task)
+            task.add_done_callback(self._handled)
+
+    def _handled(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error handling message: {task.exception()}")
+
+    async def _subscribe_stream(self, channel, handler):
+        if not self.group:
+            raise ValueError("streams mode needs a consumer group; pass group= or set MQ_GROUP")
+        print(f"Joining group {self.group} on stream {channel} as {self.consumer}")
         try:
-            pubsub = self.redis.pubsub()
-            pubsub.subscribe(channel)
-            print(f"Started listener thread for {channel}")
-            
-            for message in pubsub.listen():
-                if message['type'] == 'message':
-                    try:
-                        data = json.loads(message['data'])
-                        # Schedule the handler to run in the main event loop
-                        asyncio.run_coroutine_threadsafe(handler(data), loop)
-                    except Exception as e:
-                        print(f"Error handling message in {channel}: {e}")
+            # A new group reads the stream from its start, so messages sent
+            # before any consumer existed are kept; an existing one resumes
+            # where it stopped
+            await self.redis.xgroup_create(channel, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        key = channel.encode()
+        self.stream_handlers[key] = handler
+        # Start with entries delivered to this consumer name but never
+        # acknowledged, then switch to new ones
+        self._cursors[key] = "0"
+        if self._stream_reader is None:
+            self._stream_reader = asyncio.create_task(self._read_streams())
+        print(f"Subscribed to stream {channel}")
+
+    async def _read_streams(self):
+        """Single XREADGROUP reader for every subscribed stream"""
+        loop = asyncio.get_running_loop()
+        reclaim_interval = self.reclaim_idle_ms / 1000 / 2
+        next_reclaim = loop.time() + reclaim_interval
+        while True:
+            try:
+                await self._flush_acks()
+                started = loop.time()
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, dict(self._cursors),
+                    count=self.batch_size, block=self.block_ms
+                )
+                if not any(entries for _, entries in response or []) and \
+                        loop.time() - started < self.block_ms / 2000:
+                    # Some stand-ins (fakeredis) return at once instead of
+                    # blocking; don't spin on them
+                    await asyncio.sleep(0.005)
+                for stream, entries in response or []:
+                    if self._cursors[stream] != ">":
+                        # Pending entries are re-read from the last one seen
+                        self._cursors[stream] = entries[-1][0] if len(entries) == self.batch_size else ">"
+                    for entry_id, fields in entries:
+                        self._dispatch(stream, entry_id, fields)
+                if loop.time() >= next_reclaim:
+                    await self._reclaim()
+                    next_reclaim = loop.time() + reclaim_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in stream reader: {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim(self):
+        """Claim entries left unacknowledged for `reclaim_idle_ms`, by anyone"""
+        for stream in list(self.stream_handlers):
+            start = "0-0"
+            while True:
+                start, entries, *_ = await self.redis.xautoclaim(
+                    stream, self.group, self.consumer, self.reclaim_idle_ms,
+                    start_id=start, count=self.batch_size
+                )
+                # Still running here; the claim only reset its idle time
+                entries = [(i, f) for i, f in entries if (stream, i) not in self._in_flight]
+                if entries:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        for entry_id, _ in entries:
+                            pipe.xpending_range(stream, self.group, entry_id, entry_id, 1)
+                        pending = await pipe.execute()
+                    dead = []
+                    for (entry_id, fields), info in zip(entries, pending):
+                        deliveries = info[0]["times_delivered"] if info else 0
+                        if deliveries > self.max_deliveries:
+                            dead.append((entry_id, fields, deliveries))
+                        else:
+                            self._dispatch(stream, entry_id, fields)
+                    if dead:
+                        await self._dead_letter(stream, dead)
+                if start in (b"0-0", "0-0"):
+                    break
+
+    async def _dead_letter(self, stream, entries):
+        """Move entries that keep failing to "<stream>:dead" and acknowledge them"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for entry_id, fields, deliveries in entries:
+                print(f"Dead-lettering message {entry_id.decode()} in {stream.decode()} "
+                      f"after {deliveries - 1} deliveries")
+                pipe.xadd(stream + b":dead", {"data": (fields or {}).get(b"data", b""), "id": entry_id,
+                                              "deliveries": deliveries - 1},
+                          maxlen=self.stream_maxlen, approximate=True)
+            pipe.xack(stream, self.group, *(entry_id for entry_id, _, _ in entries))
+            await pipe.execute()
+
+    def _dispatch(self, stream, entry_id, fields):
+        # Entry ids are only unique within a stream
+        key = (stream, entry_id)
+        if key in self._in_flight:
+            return
+        try:
+            data = self.loads(fields[b"data"])
         except Exception as e:
-            print(f"Error in listener thread for {channel}: {e}")
\ No newline at end of file
+            # Trimmed or undecodable; retrying cannot help
+            print(f"Dropping message {entry_id.decode()} in {stream.decode()}: {e}")
+            self._acks.append((stream, entry_id))
+            return
+        self._in_flight.add(key)
+        task = asyncio.create_task(self.stream_handlers[stream](data))
+        self._tasks.add(task)
+        task.add_done_callback(partial(self._stream_handled, stream, entry_id))
+
+    def _stream_handled(self, stream, entry_id, task):
+        self._tasks.discard(task)
+        key = (stream, entry_id)
+        self._in_flight.discard(key)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            self._acks.append(key)
+        else:
+            # Left pending; reclaimed and retried once idle, or dead-lettered
+            print(f"Error handling message {entry_id.decode()} in {stream.decode()}: {error}")
+
+    async def _flush_acks(self):
+        """Acknowledge every handled entry, one XACK per stream in one pipeline"""
+        if not self._acks:
+            return
+        acks, self._acks = self._acks, []
+        by_stream = {}
+        for stream, entry_id in acks:
+            by_stream.setdefault(stream, []).append(entry_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for stream, ids in by_stream.items():
+                    pipe.xack(stream, self.group, *ids)
+                await pipe.execute()
+        except Exception:
+            self._acks.extend(acks)
+            raise
+
+    async def _leave_groups(self):
+        """Remove this consumer from its groups if it holds no pending entries"""
+        if self._in_flight:
+            return
+        for stream in self.stream_handlers:
+            pending = await self.redis.xpending_range(stream, self.group, "-", "+", 1, consumername=self.consumer)
+            if not pending:
+                await self.redis.xgroup_delconsumer(stream, self.group, self.consumer)
+
+    async def close(self):
+        """Send any collecting batch, stop the readers and close connections"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+            done, self._batch_done = self._batch_done, None
+            if self._pending:
+                await self._write(self._take(), done)
+                done.exception()  # retrieved here; waiters see it too
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._stream_reader is not None:
+            self._stream_reader.cancel()
+            self._stream_reader = None
+            # Handlers still running stay pending and are reclaimed later
+            try:
+                await self._flush_acks()
+                await self._leave_groups()
+            except Exception as e:
+                print(f"Error acknowledging messages on close: {e}")
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.aclose()
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
 from datetime import datetime
 import json
 
@@ -33,8 +34,8 @@ class Order(Base):
 # Database setup
 import os
 
-def get_database_url():
-    """Get database URL with proper path handling"""
+def get_database_path():
+    """Get database path with proper directory handling"""
     db_path = os.getenv("DB_PATH", "/app/data/simulation.db")
     
     # Ensure the directory exists
@@ -47,37 +48,70 @@ def get_database_url():
     if not os.access(db_dir, os.W_OK):
         print(f"Warning: No write access to {db_dir}")
     
-    return f"sqlite:///{db_path}"
+    return db_path
 
 # Initialize database connection
-database_url = get_database_url()
+db_path = get_database_path()
+database_url = f"sqlite+aiosqlite:///{db_path}"
 print(f"Using database URL: {database_url}")
 
-engine = create_engine(database_url, echo=True, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async engine: queries never block the event loop, so one uvicorn worker
+# can serve many requests at once.  WAL lets readers run alongside the
+# single writer; writers wait on busy_timeout instead of failing.  The
+# exception is a transaction that has already read: if another writer
+# committed since, its first write fails at once with SQLITE_BUSY, because
+# waiting cannot refresh its snapshot.  So handlers write with single
+# statements (UPDATE ... RETURNING), and reads that decide a write, like
+# the product lookup before an order INSERT, use a session of their own.
+#
+# The pool is kept small: SQLite has one writer whatever the pool size, and
+# its busy wait is not first-come first-served, so with dozens of
+# connections some writers starve past busy_timeout.  Waiting for a pooled
+# connection is fair.
+engine = create_async_engine(
+    database_url,
+    echo=False,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "0")),
+    pool_timeout=30,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+# expire_on_commit=False so handlers can read attributes after commit
+# without another round trip
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 def init_db():
     """Initialize database tables"""
+    # Uses a short-lived sync engine so tables exist before the event loop starts
+    sync_engine = create_engine(f"sqlite:///{db_path}", echo=False)
     try:
         print("Initializing database...")
-        # Test basic connectivity first
-        with engine.connect() as conn:
+        # Test basic connectivity first; WAL mode is persistent in the file
+        with sync_engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
             print("Database connection test successful")
         
         # Create tables
-        Base.metadata.create_all(engine)
+        Base.metadata.create_all(sync_engine)
         print("Database tables created successfully")
         return True
     except Exception as e:
         print(f"Error creating database tables: {e}")
         return False
+    finally:
+        sync_engine.dispose()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Initialize database at module level (not in async startup)
 print("Starting database initialization...")
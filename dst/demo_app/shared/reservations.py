@@ -0,0 +1,197 @@
+from sqlalchemy import select, update
+from shared.models import Product
+import asyncio
+
+class StockChanged(Exception):
+    """A product's stock moved between the batch's read and its update"""
+
+class ReservationEngine:
+    """Reserve stock for order messages in batches, with one commit per batch.
+
+    `submit` is a MessageQueue handler.  It queues the message and returns
+    once the message's batch is committed and its result published, so in
+    streams mode an order is acknowledged only after it is applied.
+    Redelivery after a crash between the commit and the acknowledgement
+    reserves the order twice, which can only under-sell.
+
+    A single task takes whatever has queued, up to `batch_size` orders,
+    waiting at most `batch_delay` for a batch to fill.  It reads the stock
+    of the batch's products once and grants orders in arrival order.
+    Each product's granted total is then taken with one
+    conditional `UPDATE products SET stock_quantity = stock_quantity - :q
+    WHERE id = :id AND stock_quantity >= :q`.  If stock changed since the
+    read, the update matches nothing and the batch is rolled back and
+    retried, so stock never goes below zero.  The whole batch is one
+    transaction, so SQLite syncs once per batch rather than once per
+    order, and all the results go out in one publish_many call.
+
+    A batch whose transaction fails is retried `retries` times.  After
+    that its results carry an "error" field and `"retryable": true`, the
+    message form of a 503: the order service marks those orders failed,
+    not rejected, so no order is left pending and none is refused for
+    what was only a database fault.  An order without an integer product
+    id and a positive integer quantity is rejected with an "error" field
+    on its own, and the rest of its batch goes ahead.
+
+    Products whose stock a batch changed are dropped from `cache`, if
+    given, and announced on the `updates` broadcast channel, one
+    broadcast_many call per batch.  Every other inventory replica then
+    drops them too, so no replica serves stock from before another
+    replica's batch.  The channel is not `product_updated`: the order
+    service caches products for their price and would otherwise lose its
+    entries on every batch.
+    """
+
+    def __init__(self, session_factory, mq, channel: str = "inventory_checked",
+                 batch_size: int = 256, batch_delay: float = 0.002, retries: int = 3, cache=None,
+                 updates: str = "stock_updated"):
+        self.session_factory = session_factory
+        self.mq = mq
+        self.channel = channel
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.retries = retries
+        self.cache = cache
+        self.updates = updates
+        self.queue = asyncio.Queue()
+        self._task = None
+        self.batches = 0
+        self.orders = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish the orders already queued, then stop"""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        self._task = None
+
+    async def submit(self, message: dict):
+        done = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((message, done))
+        await done
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            items = await self._next_batch()
+            batch = [message for message, _ in items]
+            try:
+                results = await self._reserve_with_retries(batch)
+                changed = sorted({r["product_id"] for r in results if r["available"]})
+                if self.cache is not None:
+                    for product_id in changed:
+                        self.cache.invalidate(product_id)
+                try:
+                    await self.mq.publish_many(self.channel, results)
+                    if changed and self.updates:
+                        await self.mq.broadcast_many(self.updates, [{"product_id": p} for p in changed])
+                except Exception as e:
+                    print(f"Error publishing {len(results)} reservation results: {e}")
+                self.batches += 1
+                self.orders += len(batch)
+            except asyncio.CancelledError:
+                # Maybe not committed: leave the messages unacknowledged
+                for _, done in items:
+                    done.cancel()
+                raise
+            finally:
+                for _, done in items:
+                    if not done.done():
+                        done.set_result(None)
+                    self.queue.task_done()
+
+    async def _reserve_with_retries(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self.reserve(batch)
+            except Exception as e:
+                error = e
+                print(f"Reservation batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(0.05 * 2 ** attempt)
+        return [self._result(order, False, 0, error=str(error), retryable=True) for order in batch]
+
+    async def reserve(self, batch):
+        """Apply `batch` in one transaction; returns one result per order"""
+        async with self.session_factory() as db:
+            async with db.begin():
+                valid = [self._valid(order) for order in batch]
+                product_ids = list({order["product_id"] for order, ok in zip(batch, valid) if ok})
+                stock = dict((await db.execute(
+                    select(Product.id, Product.stock_quantity)
+                    .where(Product.id.in_(product_ids))
+                )).all())
+                # Hand out stock in arrival order, then take each product's
+                # total in one conditional UPDATE
+                taken = dict.fromkeys(stock, 0)
+                results = []
+                for order, ok in zip(batch, valid):
+                    if not ok:
+                        results.append(self._result(order, False, 0, error="invalid product_id or quantity"))
+                        continue
+                    product_id = order["product_id"]
+                    quantity = order["quantity"]
+                    left = stock.get(product_id, 0)
+                    available = product_id in stock and quantity <= left
+                    if available:
+                        left -= quantity
+                        stock[product_id] = left
+                        taken[product_id] += quantity
+                    results.append(self._result(order, available, left))
+                for product_id, quantity in taken.items():
+                    if not quantity:
+                        continue
+                    applied = (await db.execute(
+                        update(Product)
+                        .where(Product.id == product_id, Product.stock_quantity >= quantity)
+                        .values(stock_quantity=Product.stock_quantity - quantity)
+                        .returning(Product.id)
+                    )).scalar_one_or_none()
+                    if applied is None:
+                        # Stock changed after the read; roll back and retry
+                        raise StockChanged(product_id)
+        for result in results:
+            if not result["available"] and "error" not in result:
+                # Report what is left once the whole batch is applied
+                result["remaining_stock"] = stock.get(result["product_id"], 0)
+        return results
+
+    @staticmethod
+    def _valid(order):
+        product_id, quantity = order.get("product_id"), order.get("quantity")
+        return type(product_id) is int and type(quantity) is int and quantity > 0
+
+    @staticmethod
+    def _result(order, available, remaining, error=None, retryable=False):
+        result = {
+            "order_id": order.get("order_id"),
+            "product_id": order.get("product_id"),
+            "quantity": order.get("quantity"),
+            "available": available,
+            "remaining_stock": remaining
+        }
+        if error is not None:
+            result["error"] = error
+        if retryable:
+            result["retryable"] = True
+        return result
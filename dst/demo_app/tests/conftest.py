@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The services import their modules as `shared.*`, relative to demo_app
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# shared.models opens its database on import
+os.environ.setdefault("DB_PATH", str(Path(tempfile.mkdtemp()) / "test.db"))
+
+pytest.importorskip("fakeredis")
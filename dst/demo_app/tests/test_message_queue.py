@@ -0,0 +1,106 @@
+import asyncio
+
+import fakeredis
+
+from shared.message_queue import MessageQueue
+
+
+def streams_mq(server, **options):
+    client = fakeredis.aioredis.FakeRedis(server=server)
+    return MessageQueue(client=client, mode="streams", group="workers", block_ms=50, **options)
+
+
+async def settle(check, timeout=3.0):
+    """Wait until `check()` is true"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not check():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def pending(mq, channel="orders"):
+    return (await mq.redis.xpending(channel, "workers"))["pending"]
+
+
+def test_consumers_split_messages_and_acknowledge_them():
+    async def main():
+        server = fakeredis.FakeServer()
+        publisher = streams_mq(server)
+        # Published before the group exists: kept for its first consumer
+        await publisher.publish_many("orders", [{"n": i} for i in range(5)])
+        seen = {"a": [], "b": []}
+        workers = []
+        for name in seen:
+            async def handler(message, name=name):
+                seen[name].append(message["n"])
+            worker = streams_mq(server, consumer=name)
+            worker.ack_batches = []
+            flush = worker._flush_acks
+            async def counted_flush(worker=worker, flush=flush):
+                if worker._acks:
+                    worker.ack_batches.append(len(worker._acks))
+                await flush()
+            worker._flush_acks = counted_flush
+            await worker.subscribe("orders", handler)
+            workers.append(worker)
+        await publisher.publish_many("orders", [{"n": i} for i in range(5, 300)])
+        await settle(lambda: len(seen["a"]) + len(seen["b"]) == 300)
+        assert sorted(seen["a"] + seen["b"]) == list(range(300))
+        await settle(lambda: not any(w._acks for w in workers))
+        await asyncio.sleep(0.1)
+        assert await pending(publisher) == 0
+        # Acknowledged many at a time, not one round trip per message
+        assert sum(len(w.ack_batches) for w in workers) < 300 / 5
+        for mq in workers + [publisher]:
+            await mq.close()
+    asyncio.run(main())
+
+
+def test_stalled_consumer_entries_are_reclaimed():
+    async def main():
+        server = fakeredis.FakeServer()
+        publisher = streams_mq(server)
+        stalled = streams_mq(server, consumer="stalled")
+        await stalled.subscribe("orders", lambda message: asyncio.sleep(3600))
+        await publisher.publish_many("orders", [{"n": i} for i in range(5)])
+        await settle(lambda: len(stalled._in_flight) == 5)
+        seen = []
+        async def handler(message):
+            seen.append(message["n"])
+        rescuer = streams_mq(server, consumer="rescuer", reclaim_idle_ms=200)
+        await rescuer.subscribe("orders", handler)
+        await settle(lambda: len(seen) == 5)
+        assert sorted(seen) == list(range(5))
+        await asyncio.sleep(0.2)
+        assert await pending(publisher) == 0
+        for mq in (stalled, rescuer, publisher):
+            await mq.close()
+    asyncio.run(main())
+
+
+def test_failing_message_is_retried_then_dead_lettered_across_restarts():
+    async def main():
+        server = fakeredis.FakeServer()
+        publisher = streams_mq(server)
+        runs = []
+        async def failing(message):
+            runs.append(message["n"])
+            raise RuntimeError("boom")
+        # One delivery fails, then the consumer restarts with a fresh process state
+        first = streams_mq(server, consumer="worker", reclaim_idle_ms=100, max_deliveries=3)
+        await first.subscribe("orders", failing)
+        await publisher.publish("orders", {"n": 7})
+        await settle(lambda: len(runs) == 1)
+        await first.close()
+        second = streams_mq(server, consumer="worker", reclaim_idle_ms=100, max_deliveries=3)
+        await second.subscribe("orders", failing)
+        await settle(lambda: len(runs) >= 3)
+        await asyncio.sleep(0.5)
+        assert runs == [7, 7, 7]
+        assert await pending(publisher) == 0
+        dead = await publisher.redis.xrange("orders:dead")
+        assert len(dead) == 1 and second.loads(dead[0][1][b"data"])["n"] == 7
+        for mq in (second, publisher):
+            await mq.close()
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+# The services' own requirements, see dst/demo_app/requirements.txt
+pytest.importorskip("fastapi")
+pytest.importorskip("aiosqlite")
+
+from shared.models import Order, Product, SessionLocal
+from shared.reservations import ReservationEngine
+import order_service
+
+
+class Recorder:
+    """Stands in for MessageQueue, keeping what was published"""
+
+    def __init__(self):
+        self.results = []
+        self.broadcasts = []
+
+    async def publish_many(self, channel, messages):
+        self.results.extend(messages)
+
+    async def broadcast_many(self, channel, messages):
+        self.broadcasts.append((channel, messages))
+
+
+async def reserve(session_factory, orders, **options):
+    mq = Recorder()
+    engine = ReservationEngine(session_factory, mq, **options)
+    engine.start()
+    await asyncio.gather(*[engine.submit(order) for order in orders])
+    await engine.stop()
+    return mq
+
+
+async def order_status(order_id):
+    async with SessionLocal() as db:
+        return (await db.get(Order, order_id)).status
+
+
+def test_refusals_are_rejected():
+    async def main():
+        async with SessionLocal() as db:
+            db.add(Product(id=101, name="scarce", price=1.0, stock_quantity=1))
+            db.add_all([Order(id=i, customer_id="c", product_id=101, quantity=1, total_amount=1.0)
+                        for i in (101, 102, 103)])
+            await db.commit()
+        mq = await reserve(SessionLocal, [
+            {"order_id": 101, "product_id": 101, "quantity": 1},
+            {"order_id": 102, "product_id": 101, "quantity": 1},
+            {"order_id": 103, "product_id": 101, "quantity": 0},
+        ])
+        results = mq.results
+        # Other inventory replicas drop the product; the order service does not listen
+        assert mq.broadcasts == [("stock_updated", [{"product_id": 101}])]
+        assert [r["available"] for r in results] == [True, False, False]
+        assert not any(r.get("retryable") for r in results)
+        for result in results:
+            await order_service.handle_inventory_response(result)
+        assert [await order_status(i) for i in (101, 102, 103)] == ["confirmed", "rejected", "rejected"]
+    asyncio.run(main())
+
+
+def test_database_faults_are_retryable():
+    def unavailable():
+        raise RuntimeError("database is locked")
+
+    async def main():
+        async with SessionLocal() as db:
+            db.add(Order(id=201, customer_id="c", product_id=101, quantity=1, total_amount=1.0))
+            await db.commit()
+        results = (await reserve(unavailable, [{"order_id": 201, "product_id": 101, "quantity": 1}],
+                                 retries=1)).results
+        assert results[0]["retryable"] and not results[0]["available"]
+        await order_service.handle_inventory_response(results[0])
+        assert await order_status(201) == "failed"
+    asyncio.run(main())
@@ -0,0 +1,278 @@
+"""Open-loop load generator for the demo order and inventory services.
+
+Orders are sent on a fixed schedule, at a constant rate or as a Poisson
+process, whatever the services are doing.  A slow response therefore
+never holds back the next request, and the offered load is the load
+asked for.  This is what the DES model assumes of its arrivals.
+
+Every latency is measured from the time its request was *scheduled* to go
+out, not from when it actually went out.  A closed-loop tester, or one
+that simply falls behind, stops sending while the system stalls.  The
+requests it would have sent never see the stall, so percentiles look far
+better than users would find them.  This is coordinated omission.
+Measuring from the schedule corrects it, as wrk2 and HdrHistogram's
+expected-interval correction do.  The uncorrected send-to-response times
+are kept too, so the difference is visible.
+
+Three histograms are reported:
+
+    response      scheduled send -> POST /orders returns (corrected)
+    service       request sent -> POST /orders returns (uncorrected)
+    end_to_end    scheduled send -> GET /orders/{id} shows a decision
+
+End-to-end times come from polling each order, first after
+``--poll-interval`` seconds and then at intervals growing by half each
+time up to ``--poll-max``.  A decision is seen late by up to the current
+interval.  Polls are not free: at high rates ``--sample`` follows only a
+fraction of the orders to their decision.  An order still pending after
+``--timeout`` is recorded at the time it was given up, which understates
+how long it really took, and counted as timed out.
+
+A response is recorded as soon as the POST returns, whether or not it was
+an error.  POSTs that time out are recorded at the time they gave up.
+All requests share one keep-alive connection pool of ``--connections``
+connections.  Time spent waiting for a pooled connection counts in
+``response`` but not in ``service``.
+
+Rates come from completion times, not from the schedule.
+``achieved_rate`` counts the POSTs that succeeded within the measured
+window, per second, and ``error_rate`` those that failed or timed out in
+it.  An overloaded service therefore shows an achieved rate below the
+target even though every request was sent on time.
+
+    python dst/load_gen.py --rate 200 --duration 30
+    python dst/load_gen.py --rate 500 --arrivals constant --json run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from histogram import LatencyHistogram  # noqa: E402
+from test_sim import SimulationTester  # noqa: E402
+
+
+class LoadGenerator(SimulationTester):
+    POLL_BACKOFF = 1.5
+
+    def __init__(self, rate, duration, arrivals="poisson", warmup=0.0, connections=100,
+                 poll_interval=0.01, timeout=30.0, seed=None, poll_max=0.25, sample=1.0):
+        super().__init__()
+        if arrivals not in ("poisson", "constant"):
+            raise ValueError(f"unknown arrival process {arrivals!r}, expected 'poisson' or 'constant'")
+        self.rate = rate
+        self.duration = duration
+        self.arrivals = arrivals
+        self.warmup = warmup
+        self.connections = connections
+        self.poll_interval = poll_interval
+        self.poll_max = poll_max
+        self.sample = sample
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        # Separate, so the arrival schedule does not depend on --sample
+        self.sampler = random.Random(None if seed is None else seed + 1)
+        self.response = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.end_to_end = LatencyHistogram()
+        self.statuses = {}
+        self.errors = 0
+        self.timed_out = 0
+        self.polls = 0
+        self.sent = 0
+        self.max_lag = 0.0
+        # POSTs finishing inside the measured window, by outcome
+        self.window_ok = 0
+        self.window_failed = 0
+        self.measure_from = self.end = None
+
+    def interarrival(self):
+        if self.arrivals == "constant":
+            return 1.0 / self.rate
+        return self.random.expovariate(self.rate)
+
+    async def create_product(self, session, stock):
+        async with session.post(
+            f"{self.inventory_service_url}/products",
+            json={"name": "Load test item", "price": 1.0, "stock_quantity": stock}
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["id"]
+
+    async def order(self, session, i, product_id, scheduled, measured, follow):
+        """Place one order and, if `follow`, poll it until inventory has decided"""
+        timing = {}
+        try:
+            async with session.post(
+                f"{self.order_service_url}/orders",
+                json={"customer_id": f"load_{i}", "product_id": product_id, "quantity": 1},
+                trace_request_ctx=timing
+            ) as resp:
+                responded = time.perf_counter()
+                if measured:
+                    self.response.record(responded - scheduled)
+                    self.service.record(responded - timing["sent"])
+                resp.raise_for_status()
+                order_id = (await resp.json())["id"]
+        except asyncio.TimeoutError:
+            self.completed(False)
+            if measured:
+                self.response.record(time.perf_counter() - scheduled)
+                self.timed_out += 1
+            return
+        except aiohttp.ClientError:
+            self.completed(False)
+            if measured:
+                self.errors += 1
+            return
+        self.completed(True)
+        if not (measured and follow):
+            return
+        try:
+            status = await self.wait_for_decision(session, order_id)
+        except asyncio.TimeoutError:
+            status = "pending"
+        except aiohttp.ClientError:
+            self.errors += 1
+            return
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.end_to_end.record(time.perf_counter() - scheduled)
+        if status == "pending":
+            self.timed_out += 1
+
+    def completed(self, ok):
+        """Count a POST that finished now, if it finished within the measured window"""
+        now = time.perf_counter()
+        if self.measure_from <= now < self.end:
+            if ok:
+                self.window_ok += 1
+            else:
+                self.window_failed += 1
+
+    @staticmethod
+    async def headers_sent(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["sent"] = time.perf_counter()
+
+    async def wait_for_decision(self, session, order_id):
+        """The order's status once decided, or "pending" after `timeout`"""
+        deadline = time.perf_counter() + self.timeout
+        interval = self.poll_interval
+        while True:
+            await asyncio.sleep(min(interval, max(deadline - time.perf_counter(), 0)))
+            async with session.get(f"{self.order_service_url}/orders/{order_id}") as resp:
+                resp.raise_for_status()
+                status = (await resp.json())["status"]
+            self.polls += 1
+            if status != "pending" or time.perf_counter() >= deadline:
+                return status
+            interval = min(interval * self.POLL_BACKOFF, self.poll_max)
+
+    async def run(self, product_id=None, stock=None):
+        connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        trace = aiohttp.TraceConfig()
+        trace.on_request_headers_sent.append(self.headers_sent)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace]) as session:
+            if product_id is None:
+                # Enough stock that every order takes the reservation path
+                if stock is None:
+                    stock = int(self.rate * (self.warmup + self.duration) * 2) + 1000
+                product_id = await self.create_product(session, stock)
+
+            tasks = set()
+            start = time.perf_counter()
+            measure_from = self.measure_from = start + self.warmup
+            end = self.end = measure_from + self.duration
+            scheduled = start
+            i = 0
+            while scheduled < end:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                measured = scheduled >= measure_from
+                follow = self.sample >= 1 or self.sampler.random() < self.sample
+                task = asyncio.create_task(self.order(session, i, product_id, scheduled, measured, follow))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if measured:
+                    self.sent += 1
+                i += 1
+                scheduled += self.interarrival()
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    def summary(self):
+        return {
+            "target_rate": self.rate,
+            "arrivals": self.arrivals,
+            "duration": self.duration,
+            "sent": self.sent,
+            "achieved_rate": self.window_ok / self.duration,
+            "error_rate": self.window_failed / self.duration,
+            "errors": self.errors,
+            "timed_out": self.timed_out,
+            "statuses": self.statuses,
+            "polls_per_followed_order": self.polls / max(self.end_to_end.count, 1),
+            "max_schedule_lag": self.max_lag,
+            # The same names replications.summarize uses for the model
+            "mean_response_time": self.end_to_end.mean,
+            "p99_response_time": self.end_to_end.percentile(99),
+            "histograms": {
+                "response": self.response.summary(),
+                "service": self.service.summary(),
+                "end_to_end": self.end_to_end.summary(),
+            },
+        }
+
+
+def print_summary(summary):
+    print(f"Target {summary['target_rate']:.1f} req/s ({summary['arrivals']}), "
+          f"sent {summary['sent']} in {summary['duration']:.1f}s, "
+          f"achieved {summary['achieved_rate']:.1f} req/s, {summary['error_rate']:.1f} errors/s, "
+          f"{summary['errors']} errors, "
+          f"{summary['timed_out']} timed out")
+    print(f"Statuses: {summary['statuses']}, {summary['polls_per_followed_order']:.1f} polls per followed order, "
+          f"max schedule lag {summary['max_schedule_lag'] * 1000:.1f} ms")
+    for name, hist in summary["histograms"].items():
+        print(f"  {name:<11} n={hist['count']:<7} mean {hist['mean'] * 1000:8.1f} ms  "
+              f"p50 {hist['p50'] * 1000:8.1f}  p99 {hist['p99'] * 1000:8.1f}  "
+              f"p99.9 {hist['p99.9'] * 1000:8.1f}  max {hist['max'] * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load test of the demo services")
+    parser.add_argument("--rate", type=float, default=100.0, help="target orders per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--connections", type=int, default=100, help="size of the keep-alive pool")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="seconds before the first poll")
+    parser.add_argument("--poll-max", type=float, default=0.25, help="longest interval between polls")
+    parser.add_argument("--sample", type=float, default=1.0,
+                        help="fraction of orders to follow to their decision")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-order limit, including polling")
+    parser.add_argument("--product-id", type=int, help="order this product instead of creating one")
+    parser.add_argument("--stock", type=int, help="stock for the created product (default: enough for every order)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.rate, args.duration, args.arrivals, args.warmup,
+                              args.connections, args.poll_interval, args.timeout, args.seed,
+                              args.poll_max, args.sample)
+    asyncio.run(generator.run(args.product_id, args.stock))
+    summary = generator.summary()
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
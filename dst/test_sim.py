@@ -19,12 +19,12 @@ class SimulationTester:
                 {"name": "Widget C", "price": 30.0, "stock_quantity": 10}
             ]
             
-            for product in products:
-                async with session.post(
-                    f"{self.inventory_service_url}/products",
-                    json=product
-                ) as resp:
-                    result = await resp.json()
+            # One round trip for all of them
+            async with session.post(
+                f"{self.inventory_service_url}/products/batch",
+                json=products
+            ) as resp:
+                for result in await resp.json():
                     print(f"Created product: {result}")
     
     async def create_order(self, session, customer_id, product_id, quantity):
@@ -74,7 +74,63 @@ class SimulationTester:
             order = await resp.json()
             print(f"Order {order_id}: {order['status']}")
     
-    async def run_simulation(self):
+    async def post_order(self, session, customer_id, product_id, quantity):
+        """Create an order without printing; returns the request latency"""
+        start_time = time.perf_counter()
+        async with session.post(
+            f"{self.order_service_url}/orders",
+            json={"customer_id": customer_id, "product_id": product_id, "quantity": quantity}
+        ) as resp:
+            await resp.read()
+            ok = resp.status == 200
+        return ok, time.perf_counter() - start_time
+    
+    async def test_throughput(self, total=1000, concurrency=50):
+        """Send `total` orders, `concurrency` at a time, and report requests/sec"""
+        print(f"\n=== Throughput: {total} orders, concurrency {concurrency} ===")
+        
+        # Plenty of stock so every order goes through the reservation path
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{self.inventory_service_url}/products",
+                json={"name": "Load test item", "price": 1.0, "stock_quantity": total}
+            ) as resp:
+                product_id = (await resp.json())["id"]
+        
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            queue = asyncio.Queue()
+            for i in range(total):
+                queue.put_nowait(i)
+            latencies = []
+            errors = 0
+            
+            async def worker():
+                nonlocal errors
+                while not queue.empty():
+                    i = queue.get_nowait()
+                    try:
+                        ok, latency = await self.post_order(session, f"load_{i}", product_id, 1)
+                    except aiohttp.ClientError:
+                        ok, latency = False, 0.0
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors += 1
+            
+            start_time = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start_time
+        
+        latencies.sort()
+        print(f"Completed {len(latencies)} orders in {elapsed:.2f}s "
+              f"({len(latencies) / elapsed:.1f} req/s), {errors} errors")
+        if latencies:
+            print(f"Latency mean {sum(latencies) / len(latencies) * 1000:.1f} ms, "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    
+    async def run_simulation(self, total=1000, concurrency=50):
         """Run the full simulation test"""
         print("Setting up test data...")
         await self.setup_test_data()
@@ -83,8 +139,16 @@ class SimulationTester:
         await asyncio.sleep(2)
         
         await self.test_race_condition()
+        
+        await self.test_throughput(total, concurrency)
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Race-condition and throughput test for the demo services")
+    parser.add_argument("--orders", type=int, default=1000, help="orders sent in the throughput phase")
+    parser.add_argument("--concurrency", type=int, default=50, help="orders in flight at once")
+    args = parser.parse_args()
+    
     # Run simulation
     tester = SimulationTester()
-    asyncio.run(tester.run_simulation())
\ No newline at end of file
+    asyncio.run(tester.run_simulation(args.orders, args.concurrency))
\ No newline at end of file
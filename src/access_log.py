@@ -0,0 +1,250 @@
+"""Replay nginx access logs through TrafficGenerator.
+
+The log needs the request timestamp, the upstream that served it and
+``$request_time``.  The default pattern expects
+
+    log_format replay '$remote_addr [$msec] "$request" $status '
+                      'rt=$request_time ua="$upstream_addr"';
+
+``[$time_local]`` is accepted in place of ``[$msec]``, at one-second
+resolution.  Pass a different ``pattern`` with the named groups ``time``,
+``upstream`` and ``request_time`` for other formats.
+
+Ingest is a generator pipeline over a memory-mapped file, so the log is
+never loaded whole.  nginx writes a line when the request finishes, so
+arrivals are ``time - request_time`` and come out slightly out of order.
+A bounded reorder buffer puts them back in order.  Parsed records go to a
+flat binary cache next to the log (``<log>.replay.bin`` plus a JSON
+sidecar).  Later replays memory-map that cache and skip parsing entirely.
+"""
+import argparse
+import calendar
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from main import TrafficGenerator
+
+DEFAULT_PATTERN = rb'\[(?P<time>[^\]]+)\].*?\brt=(?P<request_time>[0-9.]+).*?\bua="(?P<upstream>[^"]*)"'
+
+RECORD_DTYPE = np.dtype([('arrival', '<f8'), ('upstream', '<i4'), ('request_time', '<f4')])
+
+CHUNK_ROWS = 65536
+
+MONTHS = {m.encode(): i for i, m in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+def parse_time(raw: bytes) -> float:
+    """Seconds since the epoch from ``$msec`` or ``$time_local``."""
+    if b'/' not in raw:
+        return float(raw)
+    return parse_time_local(raw)
+
+
+@lru_cache(maxsize=4096)
+def parse_time_local(raw: bytes) -> float:
+    # 10/Oct/2000:13:55:36 -0700; cached because a busy log repeats each second
+    day, month, rest = raw.split(b'/', 2)
+    year, hh, mm, rest = rest.split(b':', 3)
+    ss, offset = rest.split(b' ')
+    sign = -1 if offset[:1] == b'-' else 1
+    offset_seconds = sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+    local = calendar.timegm((int(year), MONTHS[month], int(day), int(hh), int(mm), int(ss)))
+    return float(local - offset_seconds)
+
+
+def read_lines(path):
+    """Yield the lines of a file through a read-only memory map."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b'')
+
+
+def parse_lines(lines, pattern=DEFAULT_PATTERN):
+    """Yield ``(finish_time, upstream, request_time)`` for each matching line."""
+    search = re.compile(pattern).search
+    for line in lines:
+        match = search(line)
+        if match is None:
+            continue
+        upstream = match.group('upstream')
+        if upstream == b'-':
+            continue  # served by nginx itself, never reached a backend
+        # After retries $upstream_addr lists every attempt; the last one answered
+        upstream = upstream.rsplit(b',', 1)[-1].strip().decode()
+        yield parse_time(match.group('time')), upstream, float(match.group('request_time'))
+
+
+def to_arrivals(records, window=60.0):
+    """Turn finish-ordered records into arrival-ordered ``(arrival, upstream, request_time)``.
+
+    Holds a reorder buffer of at most ``window`` seconds of log time, which
+    must be at least the longest request time (proxy_read_timeout is a
+    sensible bound).
+    """
+    buffer = []
+    seq = 0
+    for finish, upstream, request_time in records:
+        heapq.heappush(buffer, (finish - request_time, seq, upstream, request_time))
+        seq += 1
+        while buffer[0][0] < finish - window:
+            arrival, _, up, rt = heapq.heappop(buffer)
+            yield arrival, up, rt
+    while buffer:
+        arrival, _, up, rt = heapq.heappop(buffer)
+        yield arrival, up, rt
+
+
+def cache_paths(log_path):
+    return f"{log_path}.replay.bin", f"{log_path}.replay.json"
+
+
+def ingest(log_path, pattern=DEFAULT_PATTERN, window=60.0):
+    """Parse a log into its binary cache, streaming in fixed-size chunks."""
+    bin_path, meta_path = cache_paths(log_path)
+    stat = os.stat(log_path)
+    upstream_ids = {}
+    chunk = np.empty(CHUNK_ROWS, dtype=RECORD_DTYPE)
+    filled = 0
+    count = 0
+    start = None
+    with open(bin_path + '.tmp', 'wb') as out:
+        for arrival, upstream, request_time in to_arrivals(parse_lines(read_lines(log_path), pattern), window):
+            if start is None:
+                start = arrival
+            chunk[filled] = (arrival - start, upstream_ids.setdefault(upstream, len(upstream_ids)), request_time)
+            filled += 1
+            if filled == CHUNK_ROWS:
+                chunk.tofile(out)
+                count += filled
+                filled = 0
+        chunk[:filled].tofile(out)
+        count += filled
+    os.replace(bin_path + '.tmp', bin_path)
+    meta = {
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'pattern': pattern.decode(),
+        'window': window,
+        'count': count,
+        'start': start,
+        'upstreams': list(upstream_ids),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+class Trace:
+    """A parsed log, memory-mapped from its binary cache."""
+
+    def __init__(self, log_path, pattern=DEFAULT_PATTERN, window=60.0, rebuild=False):
+        bin_path, meta_path = cache_paths(log_path)
+        meta = None
+        if not rebuild and os.path.exists(meta_path) and os.path.exists(bin_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stat = os.stat(log_path)
+            if (meta['source_size'], meta['source_mtime'], meta['pattern'], meta['window']) != \
+                    (stat.st_size, stat.st_mtime, pattern.decode(), window):
+                meta = None
+        if meta is None:
+            meta = ingest(log_path, pattern, window)
+        self.upstreams = meta['upstreams']
+        self.records = np.memmap(bin_path, dtype=RECORD_DTYPE, mode='r') if meta['count'] else \
+            np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return float(self.records['arrival'][-1]) if len(self.records) else 0.0
+
+    def __iter__(self):
+        names = self.upstreams
+        for offset in range(0, len(self.records), CHUNK_ROWS):
+            chunk = self.records[offset:offset + CHUNK_ROWS]
+            upstreams = [names[i] for i in chunk['upstream'].tolist()]
+            yield from zip(chunk['arrival'].tolist(), upstreams, chunk['request_time'].tolist())
+
+
+class TraceReplay:
+    """Arrival source for TrafficGenerator backed by trace records.
+
+    ``next()`` advances to the next record and returns its inter-arrival
+    gap, or infinity once the trace is exhausted.  The simulator reads the
+    service time (``service_times``) and recorded upstream of that arrival
+    while handling it, before it asks for the following gap.
+    """
+
+    def __init__(self, records):
+        self._records = iter(records)
+        self._last = 0.0
+        self.upstream = None
+        self.request_time = 0.0
+        self.service_times = _RequestTimes(self)
+
+    def next(self):
+        record = next(self._records, None)
+        if record is None:
+            return math.inf
+        arrival, self.upstream, self.request_time = record
+        gap = arrival - self._last
+        self._last = arrival
+        return gap
+
+
+class _RequestTimes:
+    def __init__(self, replay):
+        self.replay = replay
+
+    def next(self):
+        return self.replay.request_time
+
+
+def replay(trace, follow_upstream=False, **kwargs):
+    """Build a TrafficGenerator fed by ``trace``, one backend per recorded upstream.
+
+    With ``follow_upstream`` every request goes to the upstream that served
+    it in production; otherwise ``algorithm`` picks as usual.
+    """
+    source = TraceReplay(trace)
+    if follow_upstream:
+        kwargs['algorithm'] = 'trace'
+    return TrafficGenerator(source, source.service_times, server_ids=trace.upstreams, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay an nginx access log through the simulator")
+    parser.add_argument("log")
+    parser.add_argument("--algorithm", default="round_robin")
+    parser.add_argument("--follow-upstream", action="store_true",
+                        help="send each request to the upstream that served it")
+    parser.add_argument("--capacity", type=int, default=10)
+    parser.add_argument("--max-queue", type=int, default=0)
+    parser.add_argument("--window", type=float, default=60.0,
+                        help="reorder window in seconds; at least the longest request time")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the parsed-log cache")
+    args = parser.parse_args()
+
+    trace = Trace(args.log, window=args.window, rebuild=args.rebuild)
+    sim = replay(trace, follow_upstream=args.follow_upstream, algorithm=args.algorithm,
+                 capacity=args.capacity, max_queue=args.max_queue)
+    # Run one reorder window past the last arrival so replayed requests can finish
+    sim.run_simulation(trace.duration + args.window)
+    latency = sim.latency.summary()
+    print(f"Replayed requests: {sim.stats['total_requests']} over {trace.duration:.1f} seconds")
+    print(f"Dropped requests: {sim.stats['dropped_requests']}")
+    print(f"Response time mean/p50/p99/p99.9: {latency['mean']:.4f} / {latency['p50']:.4f} / "
+          f"{latency['p99']:.4f} / {latency['p99.9']:.4f} seconds")
+    print(f"Events processed: {sim.events_processed} ({sim.events_per_second:,.0f} events/sec)")
@@ -0,0 +1,212 @@
+"""Closed-form queueing estimates for TrafficGenerator configurations.
+
+The simulator's servers are ``capacity`` parallel slots with an optional
+``max_queue`` backlog each, fed by a renewal arrival process, which maps
+onto textbook multi-server models:
+
+* ``least_connections`` behaves like one pooled M/G/N/N+W system, with
+  N = num_servers * capacity slots and W = num_servers * max_queue places.
+* ``round_robin``, and ``weighted_round_robin`` with equal weights, deal
+  arrivals out in turn, so each server is treated as an independent
+  GI/G/K/K+B system fed at ``arrival_rate / num_servers`` by every
+  ``num_servers``-th arrival, whose SCV is ``ca^2 / num_servers``.
+
+The other strategies have no closed form here: ``two_choices`` and
+``ewma`` only approach the pooled system, ``consistent_hash`` loads
+servers unevenly and ``trace`` replays recorded choices.  ``estimate``
+returns None for them rather than the pooled model's optimistic numbers.
+
+Without a backlog the model is Erlang-B, exact for Poisson arrivals and
+any service distribution, with Hayward's peakedness correction for the
+smoother per-server stream under round-robin.  With a backlog the
+M/M/c/c+W wait is scaled by the Allen-Cunneen factor ``(ca^2 + cs^2) / 2``
+of the offered stream.  The backlog drop rate is the Poisson M/M/c/c+W
+one even for the smoother round-robin stream, so it overstates drops
+there.  Retries (``max_tries``) and queue timeouts are not modelled, so
+with those enabled the estimates are upper bounds on drops and latency.
+"""
+import argparse
+import math
+
+from distributions import Exponential, as_distribution
+from replications import DEFAULT_CONFIG, run_replication
+
+
+def erlang_b(servers, offered_load):
+    """Blocking probability of an M/G/c/c loss system."""
+    blocking = 1.0
+    for n in range(1, servers + 1):
+        blocking = offered_load * blocking / (n + offered_load * blocking)
+    return blocking
+
+
+def hayward(servers, offered_load, peakedness):
+    """Hayward's approximation of blocking for non-Poisson input.
+
+    Evaluates Erlang-B at ``servers / z`` and ``offered_load / z``,
+    interpolating linearly between integer server counts.
+    """
+    if peakedness == 1:
+        return erlang_b(servers, offered_load)
+    scaled = servers / peakedness
+    lower = int(scaled)
+    fraction = scaled - lower
+    load = offered_load / peakedness
+    return (1 - fraction) * erlang_b(lower, load) + fraction * erlang_b(lower + 1, load)
+
+
+def erlang_c(servers, offered_load):
+    """Probability of waiting in an M/M/c system with an unbounded queue."""
+    if offered_load >= servers:
+        return 1.0
+    blocking = erlang_b(servers, offered_load)
+    return servers * blocking / (servers - offered_load * (1 - blocking))
+
+
+def mmc_wait(servers, arrival_rate, mean_service):
+    """Mean queueing delay of an M/M/c system with an unbounded queue."""
+    capacity_rate = servers / mean_service
+    if arrival_rate >= capacity_rate:
+        return math.inf
+    return erlang_c(servers, arrival_rate * mean_service) / (capacity_rate - arrival_rate)
+
+
+def allen_cunneen_wait(servers, arrival_rate, mean_service, arrival_scv=1.0, service_scv=1.0):
+    """Allen-Cunneen approximation of the mean queueing delay in a GI/G/c queue."""
+    return mmc_wait(servers, arrival_rate, mean_service) * (arrival_scv + service_scv) / 2
+
+
+def mmc_finite(servers, waiting_room, arrival_rate, mean_service):
+    """Blocking probability and mean wait of an M/M/c/c+W system.
+
+    Works on log state probabilities, so pools of tens of thousands of
+    slots do not overflow.
+    """
+    offered_load = arrival_rate * mean_service
+    if offered_load == 0:
+        return 0.0, 0.0
+    log_load = math.log(offered_load)
+    log_p = [0.0]
+    for n in range(1, servers + 1):
+        log_p.append(log_p[-1] + log_load - math.log(n))
+    log_rho = log_load - math.log(servers)
+    for _ in range(waiting_room):
+        log_p.append(log_p[-1] + log_rho)
+    top = max(log_p)
+    weights = [math.exp(x - top) for x in log_p]
+    total = sum(weights)
+    blocking = weights[-1] / total
+    queue_length = sum(k * weights[servers + k] for k in range(1, waiting_room + 1)) / total
+    accepted = arrival_rate * (1 - blocking)
+    return blocking, queue_length / accepted if accepted else 0.0
+
+
+def estimate(config):
+    """Expected drop rate, slot utilisation and latency for a config dict.
+
+    Returns None if the config's algorithm is not modelled, or if its
+    arrivals or service times come from a source such as a trace replay
+    rather than a distribution.
+    """
+    config = {**DEFAULT_CONFIG, **config}
+    num_servers = config['num_servers']
+    algorithm = config['algorithm']
+    if algorithm == 'weighted_round_robin' and len(set(config['weights'] or [1])) == 1:
+        algorithm = 'round_robin'
+    if algorithm not in ('round_robin', 'least_connections'):
+        return None
+    if any(hasattr(config[key], 'next') for key in ('arrival_rate', 'request_size_dist')):
+        return None
+
+    arrivals = as_distribution(config['arrival_rate'], rate_like=True)
+    service = as_distribution(config['request_size_dist'])
+    arrival_rate = 1.0 / arrivals.mean()
+    mean_service = service.mean()
+    arrival_scv, service_scv = arrivals.scv(), service.scv()
+
+    if algorithm == 'round_robin':
+        groups, rate = num_servers, arrival_rate / num_servers
+        split_scv = arrival_scv / num_servers
+        slots, waiting_room = config['capacity'], config['max_queue']
+        model = "M/G/K/K+B per server"
+    elif algorithm == 'least_connections':
+        groups, rate = 1, arrival_rate
+        slots = num_servers * config['capacity']
+        waiting_room = num_servers * config['max_queue']
+        model = "pooled M/G/N/N+W"
+        split_scv = arrival_scv
+
+    if waiting_room == 0:
+        # Peakedness of a renewal stream, approximated by (1 + ca^2) / 2
+        drop_rate, wait = hayward(slots, rate * mean_service, (1 + split_scv) / 2), 0.0
+    else:
+        drop_rate, wait = mmc_finite(slots, waiting_room, rate, mean_service)
+        wait *= (split_scv + service_scv) / 2
+
+    carried = rate * (1 - drop_rate) * mean_service
+    return {
+        'model': model,
+        'offered_load': arrival_rate * mean_service,
+        'drop_rate': drop_rate,
+        'utilisation': carried / slots,
+        'mean_wait': wait,
+        'mean_response_time': mean_service + wait,
+        'servers_modelled': groups,
+    }
+
+
+def check(config, summary, tolerance=0.1, z=3.0):
+    """Compare a replication summary with theory.
+
+    Returns ``{metric: (simulated, expected, ok)}``; a metric is ok when
+    it is within ``tolerance`` relative error of theory.  The drop rate
+    is also allowed ``z`` binomial standard errors over the replication's
+    requests, so near-zero rates are not failed on a handful of drops.
+    """
+    expected = estimate(config)
+    if expected is None:
+        raise ValueError(f"no analytic model for algorithm {config.get('algorithm')!r} with these inputs")
+    report = {}
+    for metric in ('drop_rate', 'mean_response_time'):
+        simulated, theory = summary[metric], expected[metric]
+        allowed = tolerance * abs(theory)
+        if metric == 'drop_rate':
+            p = max(simulated, theory)
+            allowed += z * math.sqrt(p * (1 - p) / max(summary['total_requests'], 1))
+        report[metric] = (simulated, theory, abs(simulated - theory) <= allowed)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytic queueing estimate for a load balancer config")
+    parser.add_argument("--rate", type=float, default=DEFAULT_CONFIG['arrival_rate'])
+    parser.add_argument("--servers", type=int, default=DEFAULT_CONFIG['num_servers'])
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CONFIG['capacity'])
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_CONFIG['max_queue'])
+    parser.add_argument("--algorithm", default=DEFAULT_CONFIG['algorithm'])
+    parser.add_argument("--duration", type=float, default=DEFAULT_CONFIG['duration'])
+    parser.add_argument("--service-mean", type=float, default=None,
+                        help="exponential service times with this mean instead of the default sizes")
+    parser.add_argument("--check", action="store_true", help="also simulate once and compare with theory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = {
+        'arrival_rate': args.rate,
+        'num_servers': args.servers,
+        'capacity': args.capacity,
+        'max_queue': args.max_queue,
+        'algorithm': args.algorithm,
+        'duration': args.duration,
+    }
+    if args.service_mean:
+        config['request_size_dist'] = Exponential(1 / args.service_mean)
+    expected = estimate(config)
+    if expected is None:
+        parser.exit(1, f"no analytic model for algorithm {args.algorithm!r}\n")
+    for key, value in expected.items():
+        print(f"{key}: {value}")
+    if args.check:
+        summary = run_replication(config, args.seed)
+        for metric, (simulated, theory, ok) in check(config, summary).items():
+            print(f"{metric}: simulated {simulated:.4f} vs theory {theory:.4f} {'ok' if ok else 'MISMATCH'}")
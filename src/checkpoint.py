@@ -0,0 +1,154 @@
+"""Checkpoint, restore and fork TrafficGenerator runs.
+
+A checkpoint is the whole engine: the pending events, every server's
+in-flight requests and backlog, the strategy's state, the RNG states with
+their buffered blocks, health-check state and the statistics.  It is
+pickled and zlib-compressed into a single file with a small header.
+Restoring a checkpoint continues the run exactly as if it had never
+stopped.
+
+Uses:
+
+* Resuming long runs.  ``run_checkpointed`` saves every ``every`` seconds
+  of simulated time.  After a crash, the same call picks up from the last
+  save.
+* Warm starts.  Run once through the warm-up, checkpoint, then ``fork``
+  as many variants as needed from that steady state.  Forks that are not
+  reseeded replay the same future, so comparing them uses common random
+  numbers.  Reseeded forks are independent replications.
+
+Instrumentation is detached while saving, because its wrappers are
+closures, and it is not part of the checkpoint.  Trace replays cannot be
+checkpointed, because they read from an open iterator.
+"""
+import argparse
+import os
+import pickle
+import zlib
+
+from distributions import Exponential
+from replications import DEFAULT_CONFIG, build_simulation, summarize
+from sweep import code_version
+
+MAGIC = b'LBSIMCK1'
+
+
+def dumps(sim, level=6):
+    instrumentation = sim.instrumentation
+    if instrumentation is not None:
+        instrumentation.detach()
+    try:
+        payload = pickle.dumps({'code_version': code_version(), 'sim': sim}, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        if instrumentation is not None:
+            instrumentation.attach(sim)
+    return MAGIC + zlib.compress(payload, level)
+
+
+def loads(data, check_code=True):
+    if not data.startswith(MAGIC):
+        raise ValueError("not a simulation checkpoint")
+    state = pickle.loads(zlib.decompress(data[len(MAGIC):]))
+    if check_code and state['code_version'] != code_version():
+        raise ValueError("checkpoint was written by different simulator code; "
+                         "pass check_code=False to load it anyway")
+    return state['sim']
+
+
+def save(sim, path):
+    """Write a checkpoint atomically, so a crash mid-write keeps the previous one."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(dumps(sim))
+    os.replace(tmp, path)
+
+
+def load(path, check_code=True):
+    with open(path, 'rb') as f:
+        return loads(f.read(), check_code)
+
+
+def run_checkpointed(sim, duration, path, every):
+    """Run to ``duration``, saving to ``path`` every ``every`` simulated seconds.
+
+    If ``path`` already exists, the run resumes from it instead of ``sim``,
+    which may then be None.  The finished simulation is returned.
+    """
+    if os.path.exists(path):
+        sim = load(path)
+    elif sim._handlers is None:
+        sim.start(duration)
+    while sim.current_time < duration:
+        sim.run_until(min(sim.current_time + every, duration))
+        save(sim, path)
+    return sim
+
+
+def fork(snapshot, variant=None, seed=None):
+    """A new simulation from checkpoint bytes, with ``variant`` settings applied.
+
+    ``variant`` may change ``algorithm``/``algorithm_options``, ``capacity``,
+    ``max_queue``, ``queue_timeout`` and ``max_tries``.  ``seed`` reseeds
+    every random stream.
+    """
+    sim = loads(snapshot)
+    variant = variant or {}
+    if 'algorithm' in variant or 'algorithm_options' in variant:
+        sim.set_algorithm(variant.get('algorithm', sim.algorithm), sim.strategy_seed,
+                          **(variant.get('algorithm_options') or {}))
+    for key in ('capacity', 'max_queue', 'queue_timeout'):
+        if key in variant:
+            for server in sim.servers:
+                setattr(server, key, variant[key])
+    if 'max_tries' in variant:
+        sim.max_tries = variant['max_tries']
+    if seed is not None:
+        sim.reseed(seed)
+    for server in sim.servers:
+        # More capacity takes effect straight away for requests already waiting
+        sim.release_remote(server)
+    return sim
+
+
+def fork_variants(snapshot, variants, duration, seed=None):
+    """Run every variant from the same warm state to ``duration``; returns summaries."""
+    results = []
+    for variant in variants:
+        sim = fork(snapshot, variant, seed)
+        sim.reset_stats()
+        sim.run_until(duration)
+        results.append(summarize(sim))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up a simulation once and fork variants from it")
+    parser.add_argument("--warmup", type=float, default=100.0)
+    parser.add_argument("--duration", type=float, default=DEFAULT_CONFIG['duration'] + 100.0)
+    parser.add_argument("--rate", type=float, default=DEFAULT_CONFIG['arrival_rate'])
+    parser.add_argument("--servers", type=int, default=DEFAULT_CONFIG['num_servers'])
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CONFIG['capacity'])
+    parser.add_argument("--service-mean", type=float, default=None,
+                        help="exponential service times with this mean instead of the default sizes")
+    parser.add_argument("--algorithm", default=DEFAULT_CONFIG['algorithm'])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--variants", nargs="+", default=["round_robin", "least_connections", "two_choices"],
+                        help="algorithms to fork from the warmed-up state")
+    parser.add_argument("--save", help="also write the warmed-up checkpoint to this file")
+    args = parser.parse_args()
+
+    config = {'arrival_rate': args.rate, 'num_servers': args.servers,
+              'capacity': args.capacity, 'algorithm': args.algorithm}
+    if args.service_mean:
+        config['request_size_dist'] = Exponential(1 / args.service_mean)
+    sim = build_simulation(config, args.seed)
+    sim.warm_up(args.duration, args.warmup)
+    snapshot = dumps(sim)
+    if args.save:
+        save(sim, args.save)
+    print(f"Warmed up to t={sim.current_time:.1f}: {len(sim.event_queue)} pending events, "
+          f"checkpoint {len(snapshot) / 1024:.0f} KiB")
+    variants = [{'algorithm': algorithm} for algorithm in args.variants]
+    for algorithm, summary in zip(args.variants, fork_variants(snapshot, variants, args.duration)):
+        print(f"{algorithm}: mean {summary['mean_response_time']:.4f} s, p99 {summary['p99_response_time']:.4f} s, "
+              f"drop rate {summary['drop_rate']:.4f}")
@@ -1,2 +1,22 @@
+"""Compact event records for the discrete-event loop.
 
+Events on the simulator queue are plain tuples
 
+    (time, seq, code, request_id, server_id, arrival_time)
+
+``code`` is one of the integer event codes below and indexes straight into
+the simulator's dispatch table.  ``seq`` is a monotonically increasing
+sequence number, so two events scheduled for the same time are popped in
+the order they were pushed and the heap never has to compare the payload.
+``arrival_time`` rides along on completions so response time can be measured.
+SERVER_STATE events reuse the ``request_id`` slot for the new up/down flag.
+"""
+REQUEST_ARRIVAL = 0
+REQUEST_COMPLETION = 1
+HEALTH_CHECK = 2
+SERVER_STATE = 3
+
+EVENT_NAMES = ("request_arrival", "request_completion", "health_check", "server_state")
+
+# Tuple field positions, for code outside the hot loop that wants names
+TIME, SEQ, CODE, REQUEST_ID, SERVER_ID, ARRIVAL_TIME = range(6)
@@ -0,0 +1,132 @@
+"""nginx-style health checking and failure injection for TrafficGenerator.
+
+A backend has two states: ``is_up``, whether it really answers, and
+``is_healthy``, whether the balancer is willing to pick it.
+
+Passive checks follow ``max_fails``/``fail_timeout``.  Once ``max_fails``
+attempts fail within ``fail_timeout`` seconds, the server is taken out of
+rotation for ``fail_timeout`` seconds and then given another chance.  An
+attempt fails only when the server is down; a server whose slots and
+backlog are full still answers, so turning a request away is not a
+failure.  ``max_fails=0`` turns passive checks off.
+
+Active checks probe every server each ``interval`` seconds, like the
+``health_check`` directive.  After ``fails`` failed probes in a row a
+server is marked unhealthy, and after ``passes`` good probes it is
+marked healthy again.
+
+Probes are not one event per server.  Each interval is split into
+``spread`` HEALTH_CHECK ticks, and every tick probes a fixed slice of
+the pool.  The queue therefore holds a single pending tick however many
+servers there are.  Passive recoveries are applied on the same ticks.
+
+Outages are injected with SERVER_STATE events, one per failure and one
+per recovery.  Requests already on a failing server are allowed to
+finish.
+"""
+import heapq
+
+import numpy as np
+
+from events import HEALTH_CHECK, SERVER_STATE
+
+
+class HealthChecker:
+    def __init__(self, sim, interval=None, fails=1, passes=1, spread=1,
+                 max_fails=1, fail_timeout=10.0):
+        self.sim = sim
+        self.interval = interval
+        self.fails = fails
+        self.passes = passes
+        self.spread = spread
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        # Tick period: the active interval split into slices, or just often
+        # enough to end passive timeouts promptly when only those are on
+        self.tick = interval / spread if interval else fail_timeout / 10
+        self._slice = 0
+        self._probe_fails = {}
+        self._probe_passes = {}
+        self._window = {}  # server -> (window start, failures in window)
+        self._suspended = []  # heap of (until, seq, server) for passive timeouts
+        self._seq = 0
+        self.marked_down = 0
+        self.marked_up = 0
+
+    def start(self):
+        self.sim.schedule(self.sim.current_time + self.tick, HEALTH_CHECK, 0)
+
+    def schedule_outage(self, server_id, start, duration):
+        """Take ``server_id`` down at ``start`` and bring it back ``duration`` later."""
+        self.sim.schedule(start, SERVER_STATE, 0, server_id)
+        self.sim.schedule(start + duration, SERVER_STATE, 1, server_id)
+
+    def inject_random_failures(self, mtbf, mttr, horizon, seed=None):
+        """Exponential up/down cycles per server, mean ``mtbf`` up and ``mttr`` down."""
+        rng = np.random.default_rng(seed)
+        for server in self.sim.servers:
+            t = rng.exponential(mtbf)
+            while t < horizon:
+                downtime = rng.exponential(mttr)
+                self.schedule_outage(server.server_id, t, downtime)
+                t += downtime + rng.exponential(mtbf)
+
+    def record_failure(self, server):
+        """Passive check: count one failed attempt against ``server``."""
+        if not self.max_fails or not server.is_healthy:
+            return
+        now = self.sim.current_time
+        start, count = self._window.get(server, (now, 0))
+        if now - start > self.fail_timeout:
+            start, count = now, 0
+        count += 1
+        if count < self.max_fails:
+            self._window[server] = (start, count)
+            return
+        self._window.pop(server, None)
+        self._mark(server, False)
+        self._seq += 1
+        heapq.heappush(self._suspended, (now + self.fail_timeout, self._seq, server))
+
+    def run_tick(self):
+        sim = self.sim
+        now = sim.current_time
+        suspended = self._suspended
+        while suspended and suspended[0][0] <= now:
+            _, _, server = heapq.heappop(suspended)
+            if self.interval and self._probe_fails.get(server, 0) >= self.fails:
+                continue  # active checks still see it failing
+            # Back into rotation; a real request will tell whether it recovered
+            self._mark(server, True)
+
+        if self.interval:
+            servers = sim.servers
+            for server in servers[self._slice::self.spread]:
+                self._probe(server)
+            self._slice = (self._slice + 1) % self.spread
+
+        if now + self.tick < sim.duration:
+            sim.schedule(now + self.tick, HEALTH_CHECK, 0)
+
+    def _probe(self, server):
+        if server.is_up:
+            self._probe_fails[server] = 0
+            passes = self._probe_passes.get(server, 0) + 1
+            self._probe_passes[server] = passes
+            if not server.is_healthy and passes >= self.passes:
+                self._mark(server, True)
+        else:
+            self._probe_passes[server] = 0
+            fails = self._probe_fails.get(server, 0) + 1
+            self._probe_fails[server] = fails
+            if server.is_healthy and fails >= self.fails:
+                self._mark(server, False)
+
+    def _mark(self, server, healthy):
+        if server.is_healthy == healthy:
+            return
+        self.sim.pool.set_healthy(server, healthy)
+        if healthy:
+            self.marked_up += 1
+        else:
+            self.marked_down += 1
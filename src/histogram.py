@@ -0,0 +1,106 @@
+"""Mergeable log-bucketed latency histogram.
+
+Values are bucketed HdrHistogram-style: by binary exponent, with each
+power of two split into ``2 ** sub_bucket_bits`` linear sub-buckets.  The
+relative error of any reported value is at most ``2 ** -sub_bucket_bits``
+and the number of buckets depends only on the range of values seen, never
+on how many were recorded.
+"""
+import math
+
+
+class LatencyHistogram:
+    def __init__(self, lowest: float = 1e-6, sub_bucket_bits: int = 7):
+        self.lowest = lowest
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value):
+        if value < self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value / self.lowest)
+        sub_buckets = 1 << self.sub_bucket_bits
+        return (exponent << self.sub_bucket_bits) + int((mantissa * 2.0 - 1.0) * sub_buckets)
+
+    def _value(self, index):
+        """Midpoint of a bucket, in the recorded unit."""
+        if index == 0:
+            return 0.0
+        bits = self.sub_bucket_bits
+        exponent, sub = index >> bits, index & ((1 << bits) - 1)
+        mantissa = 0.5 + (sub + 0.5) / (2 << bits)
+        return math.ldexp(mantissa, exponent) * self.lowest
+
+    def record(self, value, count=1):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if (other.lowest, other.sub_bucket_bits) != (self.lowest, self.sub_bucket_bits):
+            raise ValueError("cannot merge histograms with different bucket layouts")
+        counts = self.counts
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Value at or below which ``q`` percent of recorded values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'p99.9': self.percentile(99.9),
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        return {
+            'lowest': self.lowest,
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'counts': self.counts,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(data['lowest'], data['sub_bucket_bits'])
+        # JSON round trips turn the integer bucket keys into strings
+        hist.counts = {int(k): v for k, v in data['counts'].items()}
+        hist.count = data['count']
+        hist.total = data['total']
+        hist.min = data['min'] if data['min'] is not None else math.inf
+        hist.max = data['max']
+        return hist
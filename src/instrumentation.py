@@ -0,0 +1,154 @@
+"""Opt-in hot-path instrumentation and profiling for TrafficGenerator.
+
+Nothing here is on the hot path unless it is attached.  ``Instrumentation``
+swaps timing wrappers in for the event handlers and for the components
+they call: server selection, the RNG streams, scheduler push/pop and
+latency recording.  ``detach`` puts the originals back.  Times are
+inclusive, so a handler's time contains the component calls it made.
+
+It can be attached before or after ``start``.  The simulator calls
+``refresh`` when it replaces a wrapped component, in ``reset_stats``,
+``set_algorithm`` and ``reseed``, so timings carry on across a warm-up
+or an algorithm switch.
+"""
+import cProfile
+import io
+import pstats
+import time
+from collections import defaultdict
+
+from events import EVENT_NAMES
+
+
+class Instrumentation:
+    def __init__(self, sample_interval=1.0):
+        self.sample_interval = sample_interval
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.max_depth = 0
+        # (simulated time, deepest event queue seen in the interval before it)
+        self.depth_series = []
+        self._window_depth = 0
+        self._next_sample = sample_interval
+        self._patched = []
+        self.sim = None
+
+    def attach(self, sim):
+        self.sim = sim
+        sim.instrumentation = self
+        self._patch_components()
+        if sim._handlers is not None:
+            # Already started: wrap the live dispatch table as well
+            sim._handlers = sim.dispatch_table()
+        return self
+
+    def refresh(self):
+        """Wrap the components again after the simulation replaced some of them."""
+        self._unpatch()
+        self._patch_components()
+
+    def detach(self):
+        self._unpatch()
+        sim = self.sim
+        if sim is not None:
+            sim.instrumentation = None
+            if sim._handlers is not None:
+                sim._handlers = sim.dispatch_table()
+
+    def _patch_components(self):
+        sim = self.sim
+        self._patch(sim, 'select_server', 'select_server')
+        self._patch(sim.interarrivals, 'next', 'rng.interarrival')
+        self._patch(sim.service_times, 'next', 'rng.service_time')
+        self._patch(sim.event_queue, 'push', 'scheduler.push')
+        self._patch(sim.event_queue, 'pop', 'scheduler.pop')
+        self._patch(sim.latency, 'record', 'stats.record')
+
+    def _unpatch(self):
+        for obj, attr, had_own, wrapper in reversed(self._patched):
+            if obj.__dict__.get(attr) is not wrapper:
+                continue  # replaced since; the replacement stays
+            if had_own is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, had_own)
+        self._patched.clear()
+
+    def _patch(self, obj, attr, name):
+        if obj is None or not hasattr(obj, attr):
+            return
+        # Remember whether the attribute lived on the instance, so detach can
+        # restore it exactly (partials) or just drop the shadowing wrapper
+        own = obj.__dict__.get(attr) if hasattr(obj, '__dict__') else None
+        wrapper = self.timed(name, getattr(obj, attr))
+        self._patched.append((obj, attr, own, wrapper))
+        setattr(obj, attr, wrapper)
+
+    def timed(self, name, fn):
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+
+        def wrapper(*args):
+            started = clock()
+            try:
+                return fn(*args)
+            finally:
+                seconds[name] += clock() - started
+                calls[name] += 1
+        return wrapper
+
+    def wrap_handlers(self, handlers):
+        """Time each dispatch-table entry and sample the event queue depth."""
+        wrapped = list(handlers)
+        for code, handler in enumerate(handlers):
+            if handler is not None:
+                wrapped[code] = self._handler(EVENT_NAMES[code], handler)
+        return wrapped
+
+    def _handler(self, name, handler):
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+        sim = self.sim
+
+        def wrapper(a, b, c):
+            started = clock()
+            handler(a, b, c)
+            seconds[name] += clock() - started
+            calls[name] += 1
+            depth = len(sim.event_queue)
+            if depth > self._window_depth:
+                self._window_depth = depth
+            if sim.current_time >= self._next_sample:
+                self._sample()
+        return wrapper
+
+    def _sample(self):
+        now = self.sim.current_time
+        self.depth_series.append((now, self._window_depth))
+        self.max_depth = max(self.max_depth, self._window_depth)
+        self._window_depth = 0
+        while self._next_sample <= now:
+            self._next_sample += self.sample_interval
+
+    def report(self):
+        if self._window_depth:
+            self._sample()
+        sim = self.sim
+        lines = [f"{'section':<22}{'calls':>12}{'total s':>12}{'us/call':>10}"]
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            calls, seconds = self.calls[name], self.seconds[name]
+            lines.append(f"{name:<22}{calls:>12,}{seconds:>12.3f}{seconds / calls * 1e6:>10.2f}")
+        if sim is not None:
+            lines.append(f"events/sec: {sim.events_per_second:,.0f} ({sim.events_processed:,} events "
+                         f"in {sim.wall_time:.3f} s)")
+        lines.append(f"max event queue depth: {self.max_depth:,}")
+        return "\n".join(lines)
+
+
+def profile_run(sim, duration, sort='cumulative', limit=30, output=None):
+    """Run ``sim`` under cProfile and return the sorted stats as text."""
+    profiler = cProfile.Profile()
+    profiler.runcall(sim.run_simulation, duration)
+    if output:
+        profiler.dump_stats(output)
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
@@ -1,6 +1,8 @@
+from collections import deque
 from enum import Enum
 from dataclasses import dataclass
 from typing import List, Dict, Optional
+from histogram import LatencyHistogram
 
 class EventType(Enum):
     REQUEST_ARRIVAL = "request_arrival"
@@ -14,15 +16,33 @@ class Event:
     data: Dict
 
 class BackendServer:
-    def __init__(self, server_id: str, capacity: int, processing_time_dist):
+    def __init__(self, server_id: str, capacity: int, processing_time_dist,
+                 max_queue: int = 0, queue_timeout: Optional[float] = None):
         self.server_id = server_id
         self.capacity = capacity
+        # Requests in service plus requests waiting, i.e. open connections
         self.current_load = 0
-        self.queue = []
+        # request_id -> completion time of each request in service
+        self.in_flight = {}
+        # Slots taken by other balancers in a sharded run, and the known
+        # times some of them free up; see sharded.py
+        self.remote_load = 0
+        self.remote_releases = deque()
+        # FIFO of (request_id, arrival_time, service_time) waiting for a free slot
+        self.queue = deque()
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.fails = 0
+        # is_up: whether the server really answers; is_healthy: whether the
+        # balancer believes it does and will pick it
+        self.is_up = True
         self.is_healthy = True
+        # nginx weight=, used by weighted_round_robin and consistent_hash
+        self.weight = 1
         self.processing_time_dist = processing_time_dist
         self.total_requests = 0
         self.total_response_time = 0.0
+        self.latency = LatencyHistogram()
 
 class NginxLoadBalancer:
     def __init__(self, servers: List[BackendServer], algorithm: str = "round_robin"):
@@ -1,121 +1,422 @@
-import heapq
-import random
-import heapq
-from lb_sim import Event, EventType, BackendServer
+import argparse
+import itertools
+import time
+from lb_sim import BackendServer
+from histogram import LatencyHistogram
+from distributions import as_stream, spawn_seeds
+from server_pool import ServerPool
+from scheduler import make_scheduler
+from strategies import STRATEGIES, make_strategy
+from health import HealthChecker
+from instrumentation import Instrumentation, profile_run
+from trace_sink import TraceSink
+from events import REQUEST_ARRIVAL, REQUEST_COMPLETION, HEALTH_CHECK, SERVER_STATE, EVENT_NAMES
 
 
 class TrafficGenerator:
-    def __init__(self, arrival_rate_dist, request_size_dist):
+    def __init__(self, arrival_rate_dist, request_size_dist, num_servers=3, capacity=10,
+                 algorithm="round_robin", seed=None, max_queue=0, queue_timeout=None,
+                 max_tries=1, server_ids=None, scheduler="heap", weights=None, algorithm_options=None,
+                 antithetic=False):
         self.arrival_rate_dist = arrival_rate_dist
         self.request_size_dist = request_size_dist
-        self.event_queue = []
+        self.seed = seed
+        # Independent, reproducible streams for arrivals, service times and
+        # selection.  Runs with the same seed see the same arrivals and service
+        # times whatever the algorithm (common random numbers); antithetic runs
+        # see their mirror image.
+        arrival_seed, service_seed, strategy_seed = spawn_seeds(seed, 3)
+        self.antithetic = antithetic
+        self.interarrivals = as_stream(arrival_rate_dist, arrival_seed, rate_like=True, antithetic=antithetic)
+        self.service_times = as_stream(request_size_dist, service_seed, antithetic=antithetic)
+        self.event_queue = make_scheduler(scheduler)
         self.current_time = 0.0
-        self.algorithm = "round_robin"  # Default load balancing algorithm
+        if server_ids is None:
+            server_ids = [f"server_{i}" for i in range(num_servers)]
         self.servers = [
-            BackendServer(server_id=f"server_{i}", capacity=10, processing_time_dist=random.choice(request_size_dist))
-            for i in range(3)  # Example with 3 backend servers
+            BackendServer(server_id=server_id, capacity=capacity,
+                          processing_time_dist=getattr(self.service_times, 'dist', None),
+                          max_queue=max_queue, queue_timeout=queue_timeout)
+            for server_id in server_ids
         ]
-        self.round_robin_index = 0
+        for server, weight in zip(self.servers, weights or ()):
+            server.weight = weight
+        # Servers tried per request before giving up, like proxy_next_upstream_tries
+        self.max_tries = max_tries
+        self.pool = ServerPool(self.servers)
+        self.health = None
+        self.instrumentation = None
+        self.trace = None
+        self.set_algorithm(algorithm, strategy_seed, **(algorithm_options or {}))
         self.total_response_time = 0.0
+        self.latency = LatencyHistogram()
         self.stats = {
             'total_requests': 0,
             'dropped_requests': 0,
+            'queued_requests': 0,
+            'timed_out_requests': 0,
+            'failed_attempts': 0,
             'total_response_time': 0.0
         }
+        self.duration = 0.0
+        # Statistics cover [measured_from, duration]; moved on by reset_stats()
+        self.measured_from = 0.0
+        self._seq = itertools.count()
+        # Id of the latest scheduled arrival; kept apart from the statistics
+        # so that reset_stats() never hands out the id of a live request
+        self.last_request_id = 0
+        self.events_processed = 0
+        self.wall_time = 0.0
+        self.events_per_second = 0.0
+        self._handlers = None
 
-    def select_server_round_robin(self):
-        healthy_servers = [s for s in self.servers if s.is_healthy]
-        if not healthy_servers:
-            return None
-        
-        server = healthy_servers[self.round_robin_index % len(healthy_servers)]
-        self.round_robin_index += 1
-        return server
-
-    def select_server_least_connections(self):
-        healthy_servers = [s for s in self.servers if s.is_healthy]
-        if not healthy_servers:
-            return None
-        
-        return min(healthy_servers, key=lambda s: s.current_load)
-    
-    def handle_request_arrival(self, event):
-        self.stats['total_requests'] += 1
-        
-        # Select backend server using configured algorithm
-        if self.algorithm == "round_robin":
-            server = self.select_server_round_robin()
-        elif self.algorithm == "least_connections":
-            server = self.select_server_least_connections()
-        
-        if not server or server.current_load >= server.capacity:
-            # Request dropped or queued based on configuration
-            self.stats['dropped_requests'] += 1
-            return
-        
+    def set_algorithm(self, algorithm, seed=None, **options):
+        """Switch the balancing strategy, also part-way through a run."""
+        self.algorithm = algorithm  # Load balancing algorithm
+        self.algorithm_options = options
+        self.strategy_seed = seed
+        self.pool.on_change = None
+        # Bound once, so choosing a backend never dispatches on the name
+        self.strategy = make_strategy(algorithm, self, seed, **options)
+        self.select_server = self.strategy.select
+        self.on_completion = getattr(self.strategy, 'completed', None)
+        self.retry_server = getattr(self.strategy, 'retry', None)
+        if self.instrumentation is not None:
+            self.instrumentation.refresh()
+
+    def reseed(self, seed):
+        """Give every random stream a fresh seed from here on.
+
+        Forks of one checkpoint otherwise replay the same future; reseeding
+        turns them into independent replications of the same warm state.
+        """
+        arrival_seed, service_seed, strategy_seed = spawn_seeds(seed, 3)
+        for stream, child in ((self.interarrivals, arrival_seed), (self.service_times, service_seed)):
+            if hasattr(stream, 'reseed'):
+                stream.reseed(child)
+        self.seed = seed
+        self.set_algorithm(self.algorithm, strategy_seed, **self.algorithm_options)
+
+    def reset_stats(self):
+        """Forget everything measured so far, e.g. at the end of a warm-up period."""
+        for key in self.stats:
+            self.stats[key] = 0.0 if key == 'total_response_time' else 0
+        self.total_response_time = 0.0
+        self.latency = LatencyHistogram()
+        if self.instrumentation is not None:
+            self.instrumentation.refresh()
+        for server in self.servers:
+            server.total_requests = 0
+            server.total_response_time = 0.0
+            server.fails = 0
+            server.latency = LatencyHistogram()
+        self.measured_from = self.current_time
+        self.events_processed = 0
+        self.wall_time = 0.0
+        self.events_per_second = 0.0
+
+    def warm_up(self, duration, warmup):
+        """Start a run to ``duration`` and discard its first ``warmup`` seconds."""
+        self.start(duration)
+        self.run_until(warmup)
+        self.reset_stats()
+
+    def __getstate__(self):
+        if self.instrumentation is not None:
+            raise ValueError("detach instrumentation before pickling a simulation")
+        state = self.__dict__.copy()
+        # The dispatch table is rebuilt on restore, and the request counter
+        # is saved as its next value
+        state['_handlers'] = self._handlers is not None
+        seq = next(self._seq)
+        self._seq = itertools.count(seq)
+        state['_seq'] = seq
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._seq = itertools.count(state['_seq'])
+        self._handlers = self.dispatch_table() if state['_handlers'] else None
+
+    def schedule(self, event_time, code, request_id, server_id=None, arrival_time=None):
+        self.event_queue.push(
+            (event_time, next(self._seq), code, request_id, server_id, arrival_time))
+
+    def instrument(self, sample_interval=1.0):
+        """Attach per-handler timing and queue-depth sampling; see instrumentation.py."""
+        return Instrumentation(sample_interval).attach(self)
+
+    def trace_requests(self, directory, **kwargs):
+        """Stream one row per request to ``directory``; see trace_sink.py.
+
+        Close the returned sink when the run is over.
+        """
+        self.trace = TraceSink(directory, self.servers, **kwargs)
+        return self.trace
+
+    def enable_health_checks(self, **kwargs):
+        """Turn on nginx-style health checks; see HealthChecker for the options."""
+        self.health = HealthChecker(self, **kwargs)
+        return self.health
+
+    def admit(self, server, request_id, service_time):
+        """Start or enqueue a request on ``server``; False if it has no room."""
+        if not server.is_up:
+            self.record_failure(server)
+            return False
+        if server.remote_releases:
+            self.release_remote(server)
+        if server.queue:
+            self.expire_waiting(server)
+        if len(server.in_flight) + server.remote_load < server.capacity:
+            self.pool.acquire(server)
+            self.start_request(server, request_id, self.current_time, service_time)
+            return True
+        if len(server.queue) < server.max_queue:
+            self.pool.acquire(server)
+            server.queue.append((request_id, self.current_time, service_time))
+            self.stats['queued_requests'] += 1
+            return True
+        # Full, but answering: not a failure for the passive health check
+        return False
+
+    def record_failure(self, server):
+        server.fails += 1
+        self.stats['failed_attempts'] += 1
+        if self.health is not None:
+            self.health.record_failure(server)
+
+    def start_request(self, server, request_id, arrival_time, service_time):
         # Process request
-        processing_time = server.processing_time_dist
-        completion_time = self.current_time + processing_time
-        self.stats['total_response_time'] += processing_time
-        
-        server.current_load += 1
-        server.queue.append(event.data['request_id'])
-        
+        completion_time = self.current_time + service_time
+        server.in_flight[request_id] = completion_time
+        if self.trace is not None:
+            self.trace.served(request_id, arrival_time, server, self.current_time, completion_time)
+
         # Schedule completion event
-        completion_event = Event(
-            time=completion_time,
-            event_type=EventType.REQUEST_COMPLETION,
-            data={'server_id': server.server_id, 'request_id': event.data['request_id']}
-        )
-        heapq.heappush(self.event_queue, (completion_time, completion_event))
-
-    def handle_request_completion(self, event):
-        server_id = event.data['server_id']
-        server = next(s for s in self.servers if s.server_id == server_id)
-        
-        server.current_load -= 1
-        server.queue.remove(event.data['request_id'])
+        self.event_queue.push((completion_time, next(self._seq),
+            REQUEST_COMPLETION, request_id, server.server_id, arrival_time))
+
+    def handle_request_arrival(self, request_id, server_id=None, arrival_time=None):
+        self.stats['total_requests'] += 1
+        # Drawn once per arrival, so request n always gets the n-th service time
+        service_time = self.service_times.next()
+
+        server = self.select_server()
+        if server is not None and not self.admit(server, request_id, service_time):
+            # Full and backlog full: try further servers, never the same one twice
+            tried = [server]
+            server = None
+            retry = self.retry_server
+            while len(tried) < self.max_tries:
+                candidate = retry(tried) if retry is not None else self.select_server()
+                if candidate is None or candidate in tried:
+                    break
+                if self.admit(candidate, request_id, service_time):
+                    server = candidate
+                    break
+                tried.append(candidate)
+
+        if server is None:
+            self.stats['dropped_requests'] += 1
+            if self.trace is not None:
+                self.trace.dropped(request_id, self.current_time)
+
+        # Schedule next arrival
+        next_arrival = self.generate_next_arrival(self.current_time)
+        if next_arrival < self.duration:
+            self.last_request_id += 1
+            self.event_queue.push((next_arrival, next(self._seq),
+                REQUEST_ARRIVAL, self.last_request_id, None, None))
+
+    def handle_request_completion(self, request_id, server_id, arrival_time):
+        server = self.pool.by_id[server_id]
+        response_time = self.current_time - arrival_time
+        if self.on_completion is not None:
+            self.on_completion(server, response_time)
+
+        self.pool.release(server)
+        del server.in_flight[request_id]
         
         # Update statistics
-        response_time = self.current_time - event.data.get('arrival_time', 0)
+        self.stats['total_response_time'] += response_time
+        self.latency.record(response_time)
         server.total_requests += 1
         server.total_response_time += response_time
-    
+        server.latency.record(response_time)
+
+        # Hand the freed slot to the oldest waiting request
+        if server.queue:
+            self.start_waiting(server)
+
+    def start_waiting(self, server):
+        """Start the oldest live request in ``server``'s backlog; False if none is left."""
+        self.expire_waiting(server)
+        if not server.queue:
+            return False
+        waiting_id, waiting_since, service_time = server.queue.popleft()
+        self.start_request(server, waiting_id, waiting_since, service_time)
+        return True
+
+    def expire_waiting(self, server):
+        """Time out the requests that have waited in ``server``'s backlog too long.
+
+        The backlog is FIFO with a single timeout, so they are always at its
+        head.  Timeouts are applied whenever the backlog is used and at the
+        end of the run, rather than with one timer event per request.
+        """
+        timeout = server.queue_timeout
+        if timeout is None:
+            return
+        queue = server.queue
+        while queue and self.current_time - queue[0][1] > timeout:
+            waiting_id, waiting_since, _ = queue.popleft()
+            self.pool.release(server)
+            self.stats['timed_out_requests'] += 1
+            self.stats['dropped_requests'] += 1
+            if self.trace is not None:
+                self.trace.dropped(waiting_id, waiting_since, server)
+
+    def set_remote_load(self, loads, releases=None):
+        """Slots of each backend held by other balancers, in ``servers`` order.
+
+        ``releases`` maps a server index to the sorted times at which some of
+        those slots are already known to free up.  Sharded runs call this at
+        window boundaries; see sharded.py.
+        """
+        servers = self.servers
+        for server, load in zip(servers, loads):
+            server.remote_load = load
+            if server.remote_releases:
+                server.remote_releases.clear()  # superseded by the new snapshot
+        for index, times in (releases or {}).items():
+            servers[index].remote_releases.extend(times)
+        for server in servers:
+            self.release_remote(server)
+
+    def release_remote(self, server):
+        """Free remote slots whose release time has passed and fill them from the backlog."""
+        releases = server.remote_releases
+        now = self.current_time
+        while releases and releases[0] <= now:
+            releases.popleft()
+            server.remote_load -= 1
+        while (server.queue and len(server.in_flight) + server.remote_load < server.capacity
+               and self.start_waiting(server)):
+            pass
+
     def generate_next_arrival(self, current_time):
-        # Exponential inter-arrival times for Poisson process
-        inter_arrival_time = random.expovariate(self.arrival_rate_dist)
-        return current_time + inter_arrival_time
+        return current_time + self.interarrivals.next()
 
-    def run_simulation(self, duration):
+    def dispatch_table(self):
+        # Indexed by integer event code, see events.py
+        handlers = [None] * len(EVENT_NAMES)
+        handlers[REQUEST_ARRIVAL] = self.handle_request_arrival
+        handlers[REQUEST_COMPLETION] = self.handle_request_completion
+        if self.health is not None:
+            handlers[HEALTH_CHECK] = self.handle_health_check
+        handlers[SERVER_STATE] = self.handle_server_state
+        if self.instrumentation is not None:
+            handlers = self.instrumentation.wrap_handlers(handlers)
+        return handlers
+
+    def handle_health_check(self, request_id, server_id, arrival_time):
+        self.health.run_tick()
+
+    def handle_server_state(self, up, server_id, arrival_time):
+        self.pool.by_id[server_id].is_up = bool(up)
+
+    def start(self, duration):
+        """Schedule the first events of a run that ends at ``duration``."""
+        self.duration = duration
         # Initialize with first request arrival
-        first_arrival = self.generate_next_arrival(0)
-        heapq.heappush(self.event_queue, (first_arrival, 
-            Event(first_arrival, EventType.REQUEST_ARRIVAL, {'request_id': 1})))
-        
-        while self.current_time < duration and self.event_queue:
-            event_time, event = heapq.heappop(self.event_queue)
+        self.last_request_id += 1
+        self.schedule(self.generate_next_arrival(0), REQUEST_ARRIVAL, self.last_request_id)
+        if self.health is not None:
+            self.health.start()
+        self._handlers = self.dispatch_table()
+
+    def run_until(self, horizon):
+        """Process every event before ``horizon``; later calls carry on from there."""
+        queue = self.event_queue
+        push, pop = queue.push, queue.pop
+        handlers = self._handlers
+        processed = 0
+        started = time.perf_counter()
+
+        while queue:
+            event_time, _, code, request_id, server_id, arrival_time = event = pop()
+            if event_time >= horizon:
+                push(event)
+                break
             self.current_time = event_time
-            
-            if event.event_type == EventType.REQUEST_ARRIVAL:
-                self.handle_request_arrival(event)
-                # Schedule next arrival
-                next_arrival = self.generate_next_arrival(event_time)
-                if next_arrival < duration:
-                    heapq.heappush(self.event_queue, (next_arrival,
-                        Event(next_arrival, EventType.REQUEST_ARRIVAL, 
-                            {'request_id': self.stats['total_requests'] + 1})))
-            
-            elif event.event_type == EventType.REQUEST_COMPLETION:
-                self.handle_request_completion(event)
+            handlers[code](request_id, server_id, arrival_time)
+            processed += 1
+        # Nothing else happens before the horizon, so the clock can move up to it
+        if self.current_time < horizon:
+            self.current_time = horizon
+        # At the end of the run, count the requests left waiting past their timeout
+        if horizon >= self.duration:
+            for server in self.servers:
+                if server.queue:
+                    self.expire_waiting(server)
+
+        self.wall_time += time.perf_counter() - started
+        self.events_processed += processed
+        self.events_per_second = self.events_processed / self.wall_time if self.wall_time > 0 else 0.0
+
+    def run_simulation(self, duration):
+        self.start(duration)
+        self.run_until(duration)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate an nginx load balancer")
+    parser.add_argument("--rate", type=float, default=1.0, help="mean arrival rate, requests per second")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--capacity", type=int, default=10)
+    parser.add_argument("--algorithm", default="round_robin", choices=sorted(STRATEGIES))
+    parser.add_argument("--weights", type=int, nargs="+", help="nginx weight= per server, in order")
+    parser.add_argument("--scheduler", default="heap")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--instrument", action="store_true",
+                        help="report per-handler call counts and time and the event queue depth")
+    parser.add_argument("--trace", metavar="DIR", help="write one row per request to columnar files in DIR")
+    parser.add_argument("--trace-format", choices=["npy", "parquet"], default="npy")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile and print sorted stats")
+    parser.add_argument("--profile-sort", default="cumulative")
+    parser.add_argument("--profile-limit", type=int, default=30)
+    parser.add_argument("--profile-output", help="also dump raw cProfile stats to this file")
+    args = parser.parse_args()
+
     sim = TrafficGenerator(
-        arrival_rate_dist=1.0,  # Mean arrival rate of 1 request per second
-        request_size_dist=[100,105,135,1000,800,200,100]  # Request size between 100 and 1000 bytes
+        arrival_rate_dist=args.rate,  # Mean arrival rate of 1 request per second by default
+        request_size_dist=[100,105,135,1000,800,200,100],  # Request size between 100 and 1000 bytes
+        num_servers=args.servers,
+        capacity=args.capacity,
+        algorithm=args.algorithm,
+        weights=args.weights,
+        seed=args.seed,
+        scheduler=args.scheduler,
     )
-    sim.run_simulation(60)  # Run for 60 seconds
+    instrumentation = sim.instrument() if args.instrument else None
+    trace = sim.trace_requests(args.trace, format=args.trace_format) if args.trace else None
+    if args.profile:
+        print(profile_run(sim, args.duration, args.profile_sort, args.profile_limit, args.profile_output))
+    else:
+        sim.run_simulation(args.duration)
+    if trace is not None:
+        trace.close()
+        print(f"Traced {trace.rows} requests in {trace.chunks} chunks to {args.trace}")
     print(f"Total requests: {sim.stats['total_requests']}")
     print(f"Dropped requests: {sim.stats['dropped_requests']}")
-    print(f"Average response time: {sim.stats['total_response_time'] / sim.stats['total_requests'] if sim.stats['total_requests'] > 0 else 0:.2f} seconds")
-    print(f"Server stats: {[{'id': s.server_id, 'load': s.current_load, 'requests': s.total_requests} for s in sim.servers]}")
+    print(f"Queued requests: {sim.stats['queued_requests']} ({sim.stats['timed_out_requests']} timed out)")
+    latency = sim.latency.summary()
+    print(f"Average response time: {latency['mean']:.2f} seconds")
+    print(f"Response time p50/p99/p99.9: {latency['p50']:.2f} / {latency['p99']:.2f} / {latency['p99.9']:.2f} seconds")
+    print(f"Server stats: {[{'id': s.server_id, 'load': s.current_load, 'waiting': len(s.queue), 'requests': s.total_requests} for s in sim.servers[:10]]}"
+          + (f" and {len(sim.servers) - 10} more" if len(sim.servers) > 10 else ""))
+    print(f"Events processed: {sim.events_processed} ({sim.events_per_second:,.0f} events/sec)")
+    if instrumentation is not None:
+        print(instrumentation.report())
     print("Simulation completed.")
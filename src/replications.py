@@ -0,0 +1,321 @@
+"""Independent replications of TrafficGenerator with confidence intervals.
+
+Each replication is a full ``run_simulation`` with its own seed, run in a
+process pool.  Replications are launched a batch at a time and the run
+stops as soon as the target metric's confidence interval is within the
+requested relative precision.
+
+Two variance-reduction techniques are available.  With ``antithetic``
+set, a replication is a pair of runs, one plain and one on mirrored
+random numbers, and their average counts as one observation.
+``run_paired`` compares algorithms under common random numbers:
+replication ``i`` of every algorithm sees the same arrivals and service
+times.  It reports confidence intervals on the per-replication
+differences, which are much narrower than comparing independent runs.
+"""
+import argparse
+import math
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from distributions import Exponential
+from histogram import LatencyHistogram
+from main import TrafficGenerator
+
+DEFAULT_CONFIG = {
+    'arrival_rate': 1.0,
+    'request_size_dist': [100, 105, 135, 1000, 800, 200, 100],
+    'num_servers': 3,
+    'capacity': 10,
+    'algorithm': 'round_robin',
+    'algorithm_options': None,
+    'weights': None,
+    'max_queue': 0,
+    'queue_timeout': None,
+    'max_tries': 1,
+    'scheduler': 'heap',
+    'antithetic': False,
+    'warmup': 0,
+    'duration': 60,
+}
+
+METRICS = ('mean_response_time', 'p50_response_time', 'p99_response_time',
+           'p999_response_time', 'drop_rate')
+
+
+def build_simulation(config, seed=None, antithetic=False):
+    config = {**DEFAULT_CONFIG, **config}
+    return TrafficGenerator(
+        arrival_rate_dist=config['arrival_rate'],
+        request_size_dist=config['request_size_dist'],
+        num_servers=config['num_servers'],
+        capacity=config['capacity'],
+        algorithm=config['algorithm'],
+        algorithm_options=config['algorithm_options'],
+        weights=config['weights'],
+        seed=seed,
+        max_queue=config['max_queue'],
+        queue_timeout=config['queue_timeout'],
+        max_tries=config['max_tries'],
+        scheduler=config['scheduler'],
+        antithetic=antithetic,
+    )
+
+
+def summarize(sim):
+    """Reduce a finished simulation to the per-replication statistics."""
+    stats = sim.stats
+    latency = sim.latency
+    duration = (sim.duration - sim.measured_from) or 1.0
+    return {
+        'total_requests': stats['total_requests'],
+        'dropped_requests': stats['dropped_requests'],
+        'mean_response_time': latency.mean,
+        'p50_response_time': latency.percentile(50),
+        'p99_response_time': latency.percentile(99),
+        'p999_response_time': latency.percentile(99.9),
+        'drop_rate': stats['dropped_requests'] / stats['total_requests'] if stats['total_requests'] else 0.0,
+        'server_load': {s.server_id: s.total_requests / duration for s in sim.servers},
+        'latency': latency.to_dict(),
+        'events_per_second': sim.events_per_second,
+    }
+
+
+def run_replication(config, seed):
+    """Run one seeded replication; top-level so the process pool can pickle it."""
+    config = {**DEFAULT_CONFIG, **config}
+    sim = simulate(config, seed)
+    if not config['antithetic']:
+        return summarize(sim)
+    mirror = simulate(config, seed, antithetic=True)
+    return average_pair(summarize(sim), summarize(mirror))
+
+
+def simulate(config, seed, antithetic=False):
+    """Build and run one simulation, measuring only after ``warmup`` seconds."""
+    sim = build_simulation(config, seed, antithetic)
+    if config['warmup']:
+        sim.warm_up(config['duration'], config['warmup'])
+        sim.run_until(config['duration'])
+    else:
+        sim.run_simulation(config['duration'])
+    return sim
+
+
+def average_pair(first, second):
+    """One observation from an antithetic pair: averaged metrics, pooled latency."""
+    pair = {key: (first[key] + second[key]) / 2 for key in METRICS + ('events_per_second',)}
+    pair['total_requests'] = first['total_requests'] + second['total_requests']
+    pair['dropped_requests'] = first['dropped_requests'] + second['dropped_requests']
+    pair['server_load'] = {server_id: (load + second['server_load'][server_id]) / 2
+                           for server_id, load in first['server_load'].items()}
+    latency = LatencyHistogram.from_dict(first['latency'])
+    latency.merge(LatencyHistogram.from_dict(second['latency']))
+    pair['latency'] = latency.to_dict()
+    return pair
+
+
+def t_quantile(p, df):
+    """Student-t quantile, exact for df 1-2 and Cornish-Fisher beyond."""
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = statistics.NormalDist().inv_cdf(p)
+    z3, z5, z7 = z ** 3, z ** 5, z ** 7
+    return (z + (z3 + z) / (4 * df)
+            + (5 * z5 + 16 * z3 + 3 * z) / (96 * df ** 2)
+            + (3 * z7 + 19 * z5 + 17 * z3 - 15 * z) / (384 * df ** 3))
+
+
+def confidence_interval(values, confidence=0.95):
+    """Return ``(mean, half_width)`` of a Student-t interval."""
+    n = len(values)
+    mean = statistics.fmean(values)
+    if n < 2:
+        return mean, math.inf
+    half = t_quantile(0.5 + confidence / 2, n - 1) * statistics.stdev(values) / math.sqrt(n)
+    return mean, half
+
+
+def merge_summaries(summaries, confidence=0.95):
+    """Combine per-replication summaries into means with confidence intervals."""
+    merged = {'replications': len(summaries), 'confidence': confidence}
+    for metric in METRICS:
+        mean, half = confidence_interval([s[metric] for s in summaries], confidence)
+        merged[metric] = {'mean': mean, 'half_width': half}
+    # Percentiles of all replications' requests pooled into one histogram
+    pooled = LatencyHistogram.from_dict(summaries[0]['latency'])
+    for s in summaries[1:]:
+        pooled.merge(LatencyHistogram.from_dict(s['latency']))
+    merged['latency'] = pooled.summary()
+    server_ids = summaries[0]['server_load']
+    merged['server_load'] = {}
+    for server_id in server_ids:
+        mean, half = confidence_interval([s['server_load'][server_id] for s in summaries], confidence)
+        merged['server_load'][server_id] = {'mean': mean, 'half_width': half}
+    return merged
+
+
+def precise_enough(values, rel_precision, confidence):
+    mean, half = confidence_interval(values, confidence)
+    if mean == 0:
+        return half == 0
+    return half / abs(mean) <= rel_precision
+
+
+def run_replications(config, replications=10, seed=None, confidence=0.95,
+                     rel_precision=None, target='mean_response_time',
+                     min_replications=3, workers=None):
+    """Run up to ``replications`` seeded runs and merge their statistics.
+
+    With ``rel_precision`` set, replications are submitted one batch of
+    ``workers`` at a time and no new batch is started once the confidence
+    interval of ``target`` is narrower than ``rel_precision`` times its mean.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    workers = workers or os.cpu_count() or 1
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(summaries) < replications:
+            batch = range(len(summaries), min(len(summaries) + workers, replications))
+            # [seed, i] keeps replication i's stream independent of the batch size
+            summaries.extend(pool.map(run_replication, [config] * len(batch), [[seed, i] for i in batch]))
+            if (rel_precision is not None and len(summaries) >= min_replications
+                    and precise_enough([s[target] for s in summaries], rel_precision, confidence)):
+                break
+    merged = merge_summaries(summaries, confidence)
+    merged['seed'] = seed
+    merged['antithetic'] = bool(config.get('antithetic'))
+    return merged
+
+
+def run_paired(config, algorithms, replications=10, seed=None, confidence=0.95, workers=None):
+    """Compare ``algorithms`` on common random numbers.
+
+    Replication ``i`` of every algorithm runs with seed ``[seed, i]``, so
+    all of them serve the same requests at the same times.  Each metric is
+    differenced against the first algorithm within a replication.  The
+    interval is then taken over those differences.  ``variance_ratio`` is
+    the variance two independent samples would have, divided by the
+    variance of the paired difference: roughly how many times fewer
+    replications the pairing needs for the same interval.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    workers = workers or os.cpu_count() or 1
+    configs = [{**config, 'algorithm': algorithm} for _ in range(replications) for algorithm in algorithms]
+    seeds = [[seed, i] for i in range(replications) for _ in algorithms]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        summaries = list(pool.map(run_replication, configs, seeds))
+    runs = {algorithm: summaries[k::len(algorithms)] for k, algorithm in enumerate(algorithms)}
+
+    baseline = algorithms[0]
+    report = {'baseline': baseline, 'replications': replications, 'seed': seed, 'confidence': confidence,
+              'antithetic': bool(config.get('antithetic')), 'algorithms': {}, 'differences': {}}
+    for algorithm in algorithms:
+        report['algorithms'][algorithm] = {
+            metric: dict(zip(('mean', 'half_width'),
+                             confidence_interval([s[metric] for s in runs[algorithm]], confidence)))
+            for metric in METRICS
+        }
+    for algorithm in algorithms[1:]:
+        differences = {}
+        for metric in METRICS:
+            base = [s[metric] for s in runs[baseline]]
+            other = [s[metric] for s in runs[algorithm]]
+            diffs = [b - a for a, b in zip(base, other)]
+            mean, half = confidence_interval(diffs, confidence)
+            paired_var = statistics.variance(diffs) if replications > 1 else math.nan
+            independent_var = statistics.variance(base) + statistics.variance(other) if replications > 1 else math.nan
+            differences[metric] = {
+                'mean': mean,
+                'half_width': half,
+                'variance_ratio': independent_var / paired_var if paired_var else math.inf,
+            }
+        report['differences'][algorithm] = differences
+    return report
+
+
+def format_paired_report(report):
+    level = int(report['confidence'] * 100)
+    kind = "antithetic pairs" if report['antithetic'] else "replications"
+    lines = [f"Paired comparison on common random numbers: {report['replications']} {kind} "
+             f"(seed {report['seed']})"]
+    for algorithm, metrics in report['algorithms'].items():
+        lines.append(f"{algorithm}:")
+        for metric in METRICS:
+            m = metrics[metric]
+            lines.append(f"  {metric}: {m['mean']:.4f} ± {m['half_width']:.4f}")
+    for algorithm, differences in report['differences'].items():
+        lines.append(f"{algorithm} - {report['baseline']} ({level}% CI of the paired difference):")
+        for metric in METRICS:
+            d = differences[metric]
+            significant = "*" if abs(d['mean']) > d['half_width'] else " "
+            lines.append(f"  {metric}: {d['mean']:+.4f} ± {d['half_width']:.4f} {significant} "
+                         f"(variance {d['variance_ratio']:.1f}x below independent runs)")
+    return "\n".join(lines)
+
+
+def format_report(merged):
+    level = int(merged['confidence'] * 100)
+    kind = " antithetic pairs" if merged.get('antithetic') else ""
+    lines = [f"Replications: {merged['replications']}{kind} (seed {merged['seed']})"]
+    for metric in METRICS:
+        m = merged[metric]
+        lines.append(f"{metric}: {m['mean']:.4f} ± {m['half_width']:.4f} ({level}% CI)")
+    pooled = merged['latency']
+    lines.append(f"pooled latency p50/p99/p99.9: {pooled['p50']:.4f} / {pooled['p99']:.4f} / {pooled['p99.9']:.4f}")
+    for server_id, m in merged['server_load'].items():
+        lines.append(f"  {server_id}: {m['mean']:.3f} ± {m['half_width']:.3f} req/s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run independent replications of the load balancer simulation")
+    parser.add_argument("--replications", type=int, default=20)
+    parser.add_argument("--precision", type=float, default=None,
+                        help="stop once the CI half-width is within this fraction of the mean")
+    parser.add_argument("--target", choices=METRICS, default='mean_response_time')
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=DEFAULT_CONFIG['arrival_rate'])
+    parser.add_argument("--servers", type=int, default=DEFAULT_CONFIG['num_servers'])
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CONFIG['capacity'])
+    parser.add_argument("--algorithm", default=DEFAULT_CONFIG['algorithm'])
+    parser.add_argument("--duration", type=float, default=DEFAULT_CONFIG['duration'])
+    parser.add_argument("--service-mean", type=float, default=None,
+                        help="exponential service times with this mean instead of the default sizes")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_CONFIG['warmup'],
+                        help="seconds simulated before statistics are collected")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="make each replication an antithetic pair of runs")
+    parser.add_argument("--compare", nargs="+", metavar="ALGORITHM",
+                        help="paired comparison of these algorithms on common random numbers; "
+                             "the first is the baseline")
+    args = parser.parse_args()
+
+    config = {
+        'arrival_rate': args.rate,
+        'num_servers': args.servers,
+        'capacity': args.capacity,
+        'algorithm': args.algorithm,
+        'duration': args.duration,
+        'antithetic': args.antithetic,
+        'warmup': args.warmup,
+    }
+    if args.service_mean:
+        config['request_size_dist'] = Exponential(1 / args.service_mean)
+    if args.compare:
+        report = run_paired(config, args.compare, args.replications, seed=args.seed,
+                            confidence=args.confidence, workers=args.workers)
+        print(format_paired_report(report))
+    else:
+        merged = run_replications(config, args.replications, seed=args.seed, confidence=args.confidence,
+                                  rel_precision=args.precision, target=args.target, workers=args.workers)
+        print(format_report(merged))
@@ -0,0 +1,101 @@
+class ServerPool:
+    """Incrementally maintained indexes over a list of BackendServers.
+
+    Keeps a ``server_id -> BackendServer`` map, a dense list of healthy
+    servers for round-robin, and the healthy servers bucketed by
+    ``current_load`` for least-connections.  All load and health changes go
+    through ``acquire``/``release``/``set_healthy`` so every index stays
+    current; each of those, and every selection, is O(1).
+
+    ``on_change``, if set, is called with a server after each of its load
+    or health changes, for strategies that keep their own index.
+    """
+
+    def __init__(self, servers):
+        self.servers = servers
+        self.by_id = {s.server_id: s for s in servers}
+        self.healthy = []
+        self._healthy_pos = {}
+        # _buckets[load] is an insertion-ordered set of healthy servers
+        self._buckets = [{}]
+        self._min_load = 0
+        self.on_change = None
+        for server in servers:
+            if server.is_healthy:
+                self._add_healthy(server)
+
+    def __len__(self):
+        return len(self.servers)
+
+    def get(self, server_id):
+        return self.by_id[server_id]
+
+    def least_loaded(self):
+        if not self.healthy:
+            return None
+        return next(iter(self._buckets[self._min_load]))
+
+    def acquire(self, server):
+        load = server.current_load
+        server.current_load = load + 1
+        if server in self._healthy_pos:
+            self._move(server, load, load + 1)
+        if self.on_change is not None:
+            self.on_change(server)
+
+    def release(self, server):
+        load = server.current_load
+        server.current_load = load - 1
+        if server in self._healthy_pos:
+            self._move(server, load, load - 1)
+        if self.on_change is not None:
+            self.on_change(server)
+
+    def set_healthy(self, server, healthy):
+        if healthy == (server in self._healthy_pos):
+            return
+        server.is_healthy = healthy
+        if healthy:
+            self._add_healthy(server)
+        else:
+            self._remove_healthy(server)
+        if self.on_change is not None:
+            self.on_change(server)
+
+    def _move(self, server, old, new):
+        buckets = self._buckets
+        del buckets[old][server]
+        if new == len(buckets):
+            buckets.append({})
+        buckets[new][server] = None
+        if new < self._min_load:
+            self._min_load = new
+        elif old == self._min_load and not buckets[old]:
+            self._min_load = new
+
+    def _add_healthy(self, server):
+        self._healthy_pos[server] = len(self.healthy)
+        self.healthy.append(server)
+        load = server.current_load
+        buckets = self._buckets
+        while len(buckets) <= load:
+            buckets.append({})
+        buckets[load][server] = None
+        if len(self.healthy) == 1 or load < self._min_load:
+            self._min_load = load
+
+    def _remove_healthy(self, server):
+        # Swap-remove from the dense healthy list
+        pos = self._healthy_pos.pop(server)
+        last = self.healthy.pop()
+        if last is not server:
+            self.healthy[pos] = last
+            self._healthy_pos[last] = pos
+        load = server.current_load
+        buckets = self._buckets
+        del buckets[load][server]
+        if not self.healthy:
+            self._min_load = 0
+        elif load == self._min_load and not buckets[load]:
+            while not buckets[self._min_load]:
+                self._min_load += 1
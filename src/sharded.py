@@ -0,0 +1,231 @@
+"""Several balancers in front of shared backends, one process per group of shards.
+
+Each shard is a full TrafficGenerator: one nginx instance with its own
+arrivals, its own connection counts and its own round-robin position.
+All shards talk to the same upstreams.  The arrival rate is split evenly,
+and a split Poisson stream is Poisson again, so each shard sees rate
+``arrival_rate / shards``.
+
+Synchronisation is conservative and windowed.  Simulated time is cut into
+windows of ``window`` seconds, and every shard runs to the end of a window
+on its own.  At each boundary the shards exchange, per backend, how many
+requests they have in service.  They also exchange the completion times
+that fall inside the next window.  Service times are drawn on admission,
+so those completions are already fixed: they are the lookahead.  A shard
+therefore sees the other balancers' slots free up at the exact simulated
+moment (``remote_load`` and ``remote_releases`` on each backend).  What
+it cannot see until the next boundary is the others' new admissions.
+Within one window a slot can be briefly oversubscribed, roughly as nginx
+instances that share no zone do.  A smaller window tracks shared capacity
+more closely, but the processes synchronise more often.  Keep it well
+below the mean service time.  Selection uses only a shard's own
+connection counts, as nginx does.  A backend that other balancers have
+filled therefore shows up as a failed attempt, not as a busier choice.
+
+Shard ``i`` is always seeded with ``[seed, i]``, as replications are.  The
+exchange happens at fixed simulated times.  Results therefore depend only
+on ``seed``, ``shards`` and ``window``, never on how shards are packed
+into worker processes or on the order in which the workers finish.
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from distributions import Exponential
+from histogram import LatencyHistogram
+from replications import DEFAULT_CONFIG, build_simulation
+
+NO_RELEASES = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+
+
+class ShardGroup:
+    """The shards owned by one worker process, by their global shard index."""
+
+    def __init__(self, config, indexes, window):
+        self.indexes = list(indexes)
+        self.window = window
+        self.sims = [build_simulation(config, [config['seed'], i]) for i in self.indexes]
+        for sim in self.sims:
+            sim.start(config['duration'])
+
+    def advance(self, horizon, remote, releases):
+        """Run every shard to ``horizon``; return its loads and the releases it knows of.
+
+        ``remote`` holds each shard's row of slots held elsewhere and
+        ``releases`` is every shard's ``(shard, server, time)`` release list
+        from the last exchange.
+        """
+        shard_ids, server_ids, times = releases
+        for i, sim, loads in zip(self.indexes, self.sims, remote):
+            others = shard_ids != i
+            order = np.lexsort((times[others], server_ids[others]))
+            servers, when = server_ids[others][order], times[others][order]
+            splits = np.flatnonzero(np.diff(servers)) + 1
+            sim.set_remote_load(loads.tolist(), {
+                int(group[0]): when_group.tolist()
+                for group, when_group in zip(np.split(servers, splits), np.split(when, splits)) if len(group)
+            })
+            sim.run_until(horizon)
+        return self.loads(), self.releases(horizon + self.window)
+
+    def loads(self):
+        return np.array([[len(s.in_flight) for s in sim.servers] for sim in self.sims], dtype=np.int64)
+
+    def releases(self, until):
+        """``(shard, server, time)`` for each request in service that completes before ``until``."""
+        rows = [(i, index, done)
+                for i, sim in zip(self.indexes, self.sims)
+                for index, server in enumerate(sim.servers)
+                for done in server.in_flight.values() if done < until]
+        if not rows:
+            return NO_RELEASES
+        shard_ids, server_ids, times = zip(*rows)
+        return np.array(shard_ids), np.array(server_ids), np.array(times)
+
+    def results(self):
+        return [{
+            'stats': sim.stats,
+            'latency': sim.latency.to_dict(),
+            'server_requests': [s.total_requests for s in sim.servers],
+            'events_processed': sim.events_processed,
+        } for sim in self.sims]
+
+
+def _serve(conn, config, indexes, window):
+    group = ShardGroup(config, indexes, window)
+    while True:
+        message = conn.recv()
+        if message is None:
+            conn.send(group.results())
+            conn.close()
+            return
+        conn.send(group.advance(*message))
+
+
+class _Local:
+    """Runs a shard group in this process, behind the same calls as a worker."""
+
+    def __init__(self, config, indexes, window):
+        self.group = ShardGroup(config, indexes, window)
+
+    def send(self, message):
+        self._reply = self.group.results() if message is None else self.group.advance(*message)
+
+    def recv(self):
+        return self._reply
+
+
+def run_sharded(config, shards=4, workers=None, seed=0, window=0.01):
+    """Simulate ``shards`` balancers over shared backends and merge their results."""
+    config = {**DEFAULT_CONFIG, **config}
+    duration = config['duration']
+    num_servers = config['num_servers']
+    shard_config = {**config, 'arrival_rate': config['arrival_rate'] / shards, 'seed': seed}
+    workers = min(workers or os.cpu_count() or 1, shards)
+    # Contiguous blocks of shards per worker; the split does not affect results
+    bounds = np.linspace(0, shards, workers + 1).astype(int)
+    blocks = [range(lo, hi) for lo, hi in zip(bounds, bounds[1:])]
+
+    if workers == 1:
+        channels = [_Local(shard_config, blocks[0], window)]
+        processes = []
+    else:
+        context = multiprocessing.get_context()
+        channels, processes = [], []
+        for block in blocks:
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child, shard_config, block, window), daemon=True)
+            process.start()
+            child.close()
+            channels.append(parent)
+            processes.append(process)
+
+    local = np.zeros((shards, num_servers), dtype=np.int64)
+    releases = NO_RELEASES
+    windows = math.ceil(duration / window)
+    try:
+        for k in range(1, windows + 1):
+            horizon = min(k * window, duration)
+            # Everything the others hold, as of the end of the last window
+            remote = local.sum(axis=0) - local
+            for channel, block in zip(channels, blocks):
+                channel.send((horizon, remote[block.start:block.stop], releases))
+            parts = []
+            for channel, block in zip(channels, blocks):
+                local[block.start:block.stop], part = channel.recv()
+                parts.append(part)
+            releases = tuple(np.concatenate(column) for column in zip(*parts))
+        results = []
+        for channel in channels:
+            channel.send(None)
+        for channel in channels:
+            results.extend(channel.recv())
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+    return merge_shards(results, config, windows)
+
+
+def merge_shards(results, config, windows):
+    stats = {key: sum(r['stats'][key] for r in results) for key in results[0]['stats']}
+    latency = LatencyHistogram.from_dict(results[0]['latency'])
+    for r in results[1:]:
+        latency.merge(LatencyHistogram.from_dict(r['latency']))
+    server_requests = np.sum([r['server_requests'] for r in results], axis=0)
+    duration = config['duration'] or 1.0
+    events = sum(r['events_processed'] for r in results)
+    return {
+        'shards': len(results),
+        'windows': windows,
+        'stats': stats,
+        'drop_rate': stats['dropped_requests'] / stats['total_requests'] if stats['total_requests'] else 0.0,
+        'latency': latency.summary(),
+        'server_load': [n / duration for n in server_requests.tolist()],
+        'events_processed': events,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate several nginx balancers sharing upstreams")
+    parser.add_argument("--shards", type=int, default=4, help="number of balancer instances")
+    parser.add_argument("--workers", type=int, default=None, help="processes; defaults to one per core")
+    parser.add_argument("--window", type=float, default=0.01,
+                        help="seconds of simulated time between backend-state exchanges")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=DEFAULT_CONFIG['arrival_rate'])
+    parser.add_argument("--servers", type=int, default=DEFAULT_CONFIG['num_servers'])
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CONFIG['capacity'])
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_CONFIG['max_queue'])
+    parser.add_argument("--algorithm", default=DEFAULT_CONFIG['algorithm'])
+    parser.add_argument("--duration", type=float, default=DEFAULT_CONFIG['duration'])
+    parser.add_argument("--service-mean", type=float, default=None,
+                        help="exponential service times with this mean instead of the default sizes")
+    args = parser.parse_args()
+
+    config = {
+        'arrival_rate': args.rate,
+        'num_servers': args.servers,
+        'capacity': args.capacity,
+        'max_queue': args.max_queue,
+        'algorithm': args.algorithm,
+        'duration': args.duration,
+    }
+    if args.service_mean:
+        config['request_size_dist'] = Exponential(1 / args.service_mean)
+    started = time.perf_counter()
+    result = run_sharded(config, args.shards, args.workers, args.seed, args.window)
+    elapsed = time.perf_counter() - started
+    stats, latency = result['stats'], result['latency']
+    print(f"Shards: {result['shards']}, windows: {result['windows']}")
+    print(f"Total requests: {stats['total_requests']}")
+    print(f"Dropped requests: {stats['dropped_requests']} ({result['drop_rate']:.2%})")
+    print(f"Response time mean/p50/p99/p99.9: {latency['mean']:.4f} / {latency['p50']:.4f} / "
+          f"{latency['p99']:.4f} / {latency['p99.9']:.4f} seconds")
+    print(f"Events processed: {result['events_processed']:,} in {elapsed:.2f} s "
+          f"({result['events_processed'] / elapsed:,.0f} events/sec)")
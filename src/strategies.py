@@ -0,0 +1,249 @@
+"""Backend selection strategies for TrafficGenerator.
+
+A strategy is built once per simulation and ``select()`` is bound as the
+simulator's ``select_server``, so the hot path never dispatches on the
+algorithm name.  ``select()`` returns a healthy BackendServer or None.
+Strategies that learn from response times also define
+``completed(server, response_time)``, and strategies that pick a
+request's next upstream in their own way define ``retry(tried)``; the
+others are just asked to ``select()`` again.  Every selection is O(1) or
+O(log n) in the number of servers:
+
+    round_robin           O(1)      dense healthy list
+    least_connections     O(1)      ServerPool load buckets
+    two_choices           O(1)      two random healthy servers, the less loaded
+    weighted_round_robin  O(log n)  nginx ``weight=``, as stride scheduling
+    consistent_hash       O(log n)  ketama-style ring with virtual nodes
+    ewma                  O(log n)  lowest EWMA latency x (connections + 1)
+    trace                 O(1)      the upstream a replayed request used
+"""
+import hashlib
+import heapq
+import itertools
+from bisect import bisect
+
+import numpy as np
+
+from distributions import Empirical, Stream, Uniform
+
+
+class RoundRobin:
+    def __init__(self, sim):
+        self.healthy = sim.pool.healthy
+        self.index = 0
+
+    def select(self):
+        healthy = self.healthy
+        if not healthy:
+            return None
+        server = healthy[self.index % len(healthy)]
+        self.index += 1
+        return server
+
+
+class LeastConnections:
+    def __init__(self, sim):
+        self.select = sim.pool.least_loaded
+
+
+class TwoChoices:
+    """Power of two random choices: sample two healthy servers, take the less loaded."""
+
+    def __init__(self, sim, seed=None):
+        self.healthy = sim.pool.healthy
+        self.uniform = Stream(Uniform(), seed)
+
+    def select(self):
+        healthy = self.healthy
+        n = len(healthy)
+        if n < 2:
+            return healthy[0] if n else None
+        draw = self.uniform.next
+        i = int(draw() * n)
+        j = int(draw() * (n - 1))
+        if j >= i:
+            j += 1  # two distinct servers
+        a, b = healthy[i], healthy[j]
+        return b if b.current_load < a.current_load else a
+
+
+class WeightedRoundRobin:
+    """nginx ``weight=`` balancing with an indexed heap.
+
+    nginx's smooth weighted round-robin scans every server on each pick.
+    Stride scheduling spreads picks just as evenly and in the same
+    proportions.  Each server's pass advances by ``1 / weight`` when it is
+    picked, and the server with the lowest pass goes next.  Unhealthy
+    servers keep their turn order but are stepped over.
+    """
+
+    def __init__(self, sim):
+        self.pool = sim.pool
+        self.heap = [(1.0 / s.weight, i, s) for i, s in enumerate(sim.servers)]
+        heapq.heapify(self.heap)
+
+    def select(self):
+        if not self.pool.healthy:
+            return None
+        heap = self.heap
+        while True:
+            passed, order, server = heap[0]
+            heapq.heapreplace(heap, (passed + 1.0 / server.weight, order, server))
+            if server.is_healthy:
+                return server
+
+
+def ring_hash(key):
+    """First 8 bytes of md5, as ketama uses for its continuum."""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class ConsistentHash:
+    """``hash $key consistent``: a sorted ring of virtual nodes searched with bisect.
+
+    Each request carries a client key drawn from ``clients`` clients.
+    Keys are uniform, or Zipf-distributed with exponent ``skew``.  A key
+    goes to the first virtual node clockwise from its hash.  If that
+    server is unhealthy, the walk continues round the ring, so only that
+    server's keys move elsewhere.  A retry keeps the request's key and
+    carries on clockwise to the next server not yet tried, like nginx.
+    """
+
+    def __init__(self, sim, seed=None, vnodes=160, clients=10000, skew=0.0):
+        points = sorted((ring_hash(f"{s.server_id}-{v}"), i)
+                        for i, s in enumerate(sim.servers) for v in range(vnodes * s.weight))
+        self.hashes = [h for h, _ in points]
+        self.ring = [sim.servers[i] for _, i in points]
+        self.healthy = sim.pool.healthy
+        if skew:
+            weights = 1.0 / np.arange(1, clients + 1) ** skew
+            self.clients = Stream(Empirical(np.arange(clients), weights), seed)
+        else:
+            self.clients = Stream(Uniform(0, clients), seed)
+        self._positions = {}
+        self._position = 0  # ring position of the latest pick
+
+    def select(self):
+        if not self.healthy:
+            return None
+        client = int(self.clients.next())
+        position = self._positions.get(client)
+        if position is None:
+            position = bisect(self.hashes, ring_hash(f"client-{client}")) % len(self.ring)
+            self._positions[client] = position
+        ring = self.ring
+        server = ring[position]
+        while not server.is_healthy:
+            position = (position + 1) % len(ring)
+            server = ring[position]
+        self._position = position
+        return server
+
+    def retry(self, tried):
+        """The next healthy server clockwise from the latest pick that is not in ``tried``."""
+        ring = self.ring
+        position = self._position
+        for _ in range(len(ring) - 1):
+            position = (position + 1) % len(ring)
+            server = ring[position]
+            if server.is_healthy and server not in tried:
+                self._position = position
+                return server
+        return None
+
+
+class EWMALeastLatency:
+    """Lowest ``ewma latency * (connections + 1)``, like nginx's ``least_time``.
+
+    The latency average decays by ``decay`` per completed request.
+    Servers with no samples yet score zero and so are tried first.  Scores
+    sit in a heap that is updated lazily.  Every load, health or latency
+    change pushes a fresh entry and bumps the server's version.  Outdated
+    entries are dropped when they surface, and the heap is rebuilt once
+    they outnumber the live ones.
+    """
+
+    def __init__(self, sim, decay=0.1):
+        self.decay = decay
+        self.servers = sim.servers
+        self.ewma = {s: 0.0 for s in sim.servers}
+        self.version = {s: 0 for s in sim.servers}
+        self._seq = itertools.count()
+        self.heap = [(0.0, s.current_load, next(self._seq), 0, s) for s in sim.servers if s.is_healthy]
+        heapq.heapify(self.heap)
+        sim.pool.on_change = self.changed
+
+    def changed(self, server):
+        version = self.version[server] + 1
+        self.version[server] = version
+        if server.is_healthy:
+            load = server.current_load
+            heapq.heappush(self.heap, (self.ewma[server] * (load + 1), load, next(self._seq), version, server))
+            if len(self.heap) > 4 * len(self.servers) + 64:
+                self._rebuild()
+
+    def completed(self, server, response_time):
+        ewma = self.ewma[server]
+        self.ewma[server] = ewma + self.decay * (response_time - ewma) if ewma else response_time
+        # The pool release that follows pushes the new score
+
+    def select(self):
+        heap, version = self.heap, self.version
+        while heap:
+            entry = heap[0]
+            server = entry[4]
+            if entry[3] == version[server] and server.is_healthy:
+                return server
+            heapq.heappop(heap)
+        return None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        seq = next(self._seq)
+        self._seq = itertools.count(seq)
+        state['_seq'] = seq
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._seq = itertools.count(state['_seq'])
+
+    def _rebuild(self):
+        self.heap = [entry for entry in self.heap
+                     if entry[3] == self.version[entry[4]] and entry[4].is_healthy]
+        heapq.heapify(self.heap)
+
+
+class TraceUpstream:
+    """Replay the upstream recorded for the current trace request."""
+
+    def __init__(self, sim):
+        self.by_id = sim.pool.by_id
+        self.source = sim.interarrivals
+
+    def select(self):
+        return self.by_id[self.source.upstream]
+
+
+STRATEGIES = {
+    'round_robin': RoundRobin,
+    'least_connections': LeastConnections,
+    'two_choices': TwoChoices,
+    'weighted_round_robin': WeightedRoundRobin,
+    'consistent_hash': ConsistentHash,
+    'ewma': EWMALeastLatency,
+    'trace': TraceUpstream,
+}
+
+# Strategies that draw random numbers and take a ``seed``
+RANDOMISED = (TwoChoices, ConsistentHash)
+
+
+def make_strategy(name, sim, seed=None, **options):
+    try:
+        cls = STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"unknown algorithm {name!r}, expected one of {sorted(STRATEGIES)}") from None
+    if cls in RANDOMISED:
+        options['seed'] = seed
+    return cls(sim, **options)
@@ -0,0 +1,193 @@
+"""Parameter sweeps over simulation configs with an on-disk result cache.
+
+Every (config, replication seed) pair is one unit of work.  Its summary is
+stored under a hash of the full config, the seed and the simulator source,
+so re-running a sweep only computes the points whose inputs changed.
+Points can also be estimated analytically, or pruned before simulation
+when theory already says they drop too much (see analytic.py).
+
+    python sweep.py --grid '{"algorithm": ["round_robin", "least_connections"],
+                             "arrival_rate": [1, 2, 5]}' --replications 5
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from analytic import estimate
+from replications import DEFAULT_CONFIG, METRICS, merge_summaries, run_replication
+
+SRC_DIR = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = ".sweep_cache"
+
+
+def expand_grid(grid):
+    """Cartesian product of ``{param: [values]}`` as a list of configs."""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def code_version():
+    """Hash of the simulator sources, so cached results expire on code changes."""
+    digest = hashlib.sha256()
+    for path in sorted(SRC_DIR.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def canonical(value):
+    """JSON form of config values json cannot encode; never an object's address."""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"cannot use {type(value).__name__} in a cache key; give it a to_dict()")
+
+
+def cache_key(config, seed, version):
+    payload = json.dumps({'config': {**DEFAULT_CONFIG, **config}, 'seed': seed, 'code': version},
+                         sort_keys=True, default=canonical)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed JSON files, one per (config, seed, code version)."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        try:
+            return json.loads(self._path(key).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename, so an interrupted sweep never leaves a torn entry
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(result))
+        tmp.replace(path)
+
+
+def run_sweep(configs, replications=1, seed=0, workers=None, cache_dir=DEFAULT_CACHE_DIR,
+              confidence=0.95, mode='simulate', prune_drop_rate=None):
+    """Run every config for ``replications`` seeds, reusing cached units.
+
+    All points share the replication seeds ``[seed, 0..replications-1]``, so
+    differences between points are not drowned in seed-to-seed noise.
+    With ``mode='analytic'`` nothing is simulated and each point gets the
+    closed-form estimate instead.  With ``prune_drop_rate`` set, points
+    whose estimated drop rate exceeds it are not simulated.  Points whose
+    algorithm has no analytic model get ``analytic`` None and are never
+    pruned.
+
+    Returns one ``{'config', 'status', 'result', 'analytic'}`` entry per
+    config, where status is ``simulated``, ``cached``, ``analytic`` or
+    ``pruned``.
+    """
+    points = [{'config': config, 'status': 'analytic', 'result': None, 'analytic': None}
+              for config in configs]
+    if mode == 'analytic' or prune_drop_rate is not None:
+        for point in points:
+            point['analytic'] = estimate(point['config'])
+    if mode == 'analytic':
+        return points
+
+    to_simulate = []
+    for point in points:
+        expected = point['analytic']
+        if prune_drop_rate is not None and expected and expected['drop_rate'] > prune_drop_rate:
+            point['status'] = 'pruned'
+        else:
+            to_simulate.append(point)
+
+    cache = ResultCache(cache_dir)
+    version = code_version()
+    units = {}
+    for point in to_simulate:
+        for i in range(replications):
+            key = cache_key(point['config'], [seed, i], version)
+            if key not in units:
+                units[key] = (point['config'], [seed, i])
+
+    results = {}
+    missing = []
+    for key, unit in units.items():
+        cached = cache.get(key)
+        if cached is None:
+            missing.append(key)
+        else:
+            results[key] = cached
+
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            computed = pool.map(run_replication, *zip(*(units[key] for key in missing)))
+            for key, result in zip(missing, computed):
+                cache.put(key, result)
+                results[key] = result
+
+    missing = set(missing)
+    for point in to_simulate:
+        keys = [cache_key(point['config'], [seed, i], version) for i in range(replications)]
+        point['result'] = merge_summaries([results[key] for key in keys], confidence)
+        point['status'] = 'simulated' if any(key in missing for key in keys) else 'cached'
+    return points
+
+
+def format_table(points):
+    params = sorted({k for p in points for k in p['config']})
+    header = params + list(METRICS) + ['status']
+    rows = [header]
+    for point in points:
+        row = [str(point['config'].get(k, '')) for k in params]
+        for metric in METRICS:
+            if point['result'] is not None:
+                m = point['result'][metric]
+                row.append(f"{m['mean']:.4g} ± {m['half_width']:.2g}")
+            elif point['analytic'] and metric in point['analytic']:
+                row.append(f"~{point['analytic'][metric]:.4g}")
+            else:
+                row.append('-')
+        row.append(point['status'])
+        rows.append(row)
+    widths = [max(len(r[i]) for r in rows) for i in range(len(header))]
+    return "\n".join("  ".join(c.ljust(w) for c, w in zip(r, widths)) for r in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep load balancer simulation parameters")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--grid", help="JSON object mapping parameter name to a list of values")
+    source.add_argument("--configs", help="path to a JSON file holding a list of config objects")
+    parser.add_argument("--replications", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--mode", choices=("simulate", "analytic"), default="simulate")
+    parser.add_argument("--prune-drop-rate", type=float, default=None,
+                        help="skip simulating points whose analytic drop rate exceeds this")
+    parser.add_argument("--output", help="write the full results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.grid:
+        configs = expand_grid(json.loads(args.grid))
+    else:
+        configs = json.loads(Path(args.configs).read_text())
+
+    points = run_sweep(configs, args.replications, args.seed, args.workers, args.cache_dir,
+                       mode=args.mode, prune_drop_rate=args.prune_drop_rate)
+    print(format_table(points))
+    if args.output:
+        Path(args.output).write_text(json.dumps(points, indent=2, default=str))
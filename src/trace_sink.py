@@ -0,0 +1,178 @@
+"""Per-request trace output in chunked columnar files.
+
+Attach a ``TraceSink`` with ``TrafficGenerator.trace_requests`` and every
+request becomes one row:
+
+    request_id  int64    arrival order, starting at 1
+    arrival     float64  time the request reached the balancer
+    server      int32    index into the manifest's ``servers``, -1 if never placed
+    start       float64  time service started, NaN if it never did
+    finish      float64  time service ended, NaN if it never did
+    dropped     bool     rejected outright, or timed out in a backlog
+
+A served request is written when its service starts, because its finish
+time is already known then.  Rows therefore come out in start order, and
+a request still in service at the end of a run has ``finish`` past the
+end.  Rejected requests are written on arrival, and timed-out requests
+when the timeout is noticed.
+
+Rows collect in compact ``array`` buffers of ``chunk_rows`` entries and
+are then written out as one chunk.  Memory stays at one chunk however
+long the run is.  With ``format='npy'`` each chunk is a directory holding
+one ``.npy`` file per column.  With ``format='parquet'``, which needs
+pyarrow, each chunk is a row group of a single ``trace.parquet``.
+``manifest.json`` is rewritten after every chunk, so a run that dies
+part-way still leaves a readable trace.  ``TraceReader`` memory-maps the
+files.
+"""
+import json
+import math
+import os
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = {
+    'request_id': ('q', np.int64),
+    'arrival': ('d', np.float64),
+    'server': ('i', np.int32),
+    'start': ('d', np.float64),
+    'finish': ('d', np.float64),
+    'dropped': ('B', np.bool_),
+}
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+NAN = math.nan
+
+
+class TraceSink:
+    def __init__(self, directory, servers, chunk_rows=DEFAULT_CHUNK_ROWS, format='npy'):
+        if format == 'parquet' and pyarrow is None:
+            raise ValueError("format='parquet' needs pyarrow; use format='npy'")
+        if format not in ('npy', 'parquet'):
+            raise ValueError(f"unknown trace format {format!r}, expected 'npy' or 'parquet'")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.chunk_rows = chunk_rows
+        self.server_ids = [s.server_id for s in servers]
+        self._index = {s: i for i, s in enumerate(servers)}
+        self.chunks = 0
+        self.rows = 0
+        self._writer = None
+        self._reset()
+
+    def _reset(self):
+        self._columns = [array(code) for code, _ in COLUMNS.values()]
+        (self._request_id, self._arrival, self._server,
+         self._start, self._finish, self._dropped) = self._columns
+
+    def served(self, request_id, arrival, server, start, finish):
+        self._request_id.append(request_id)
+        self._arrival.append(arrival)
+        self._server.append(self._index[server])
+        self._start.append(start)
+        self._finish.append(finish)
+        self._dropped.append(0)
+        if len(self._request_id) >= self.chunk_rows:
+            self.flush()
+
+    def dropped(self, request_id, arrival, server=None):
+        self._request_id.append(request_id)
+        self._arrival.append(arrival)
+        self._server.append(-1 if server is None else self._index[server])
+        self._start.append(NAN)
+        self._finish.append(NAN)
+        self._dropped.append(1)
+        if len(self._request_id) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one chunk."""
+        if not self._request_id:
+            return
+        data = {name: np.frombuffer(column, dtype=dtype)
+                for (name, (_, dtype)), column in zip(COLUMNS.items(), self._columns)}
+        if self.format == 'npy':
+            chunk = self.directory / f"chunk-{self.chunks:05d}"
+            chunk.mkdir(exist_ok=True)
+            for name, values in data.items():
+                np.save(chunk / f"{name}.npy", values)
+        else:
+            table = pyarrow.table(data)
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self.directory / "trace.parquet", table.schema)
+            self._writer.write_table(table)
+        self.rows += len(self._request_id)
+        self.chunks += 1
+        self._reset()
+        self._write_manifest()
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._write_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_manifest(self):
+        manifest = {
+            'format': self.format,
+            'columns': {name: np.dtype(dtype).str for name, (_, dtype) in COLUMNS.items()},
+            'chunks': self.chunks,
+            'rows': self.rows,
+            'servers': self.server_ids,
+        }
+        tmp = self.directory / "manifest.json.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.directory / "manifest.json")
+
+
+class TraceReader:
+    """Memory-mapped access to a trace written by TraceSink."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / "manifest.json") as f:
+            self.manifest = json.load(f)
+        self.servers = self.manifest['servers']
+        self._table = None
+        if self.manifest['format'] == 'parquet':
+            if pyarrow is None:
+                raise ValueError("reading a parquet trace needs pyarrow")
+            self._table = pyarrow.parquet.read_table(self.directory / "trace.parquet", memory_map=True)
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def chunks(self):
+        """Yield each chunk as ``{column: array}``; npy columns are memory-mapped."""
+        if self._table is not None:
+            for batch in self._table.to_batches():
+                yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in COLUMNS}
+            return
+        for i in range(self.manifest['chunks']):
+            chunk = self.directory / f"chunk-{i:05d}"
+            yield {name: np.load(chunk / f"{name}.npy", mmap_mode='r') for name in COLUMNS}
+
+    def column(self, name):
+        """One column over the whole trace, in a single in-memory array."""
+        if self._table is not None:
+            return self._table.column(name).to_numpy()
+        parts = [chunk[name] for chunk in self.chunks()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS[name][1])
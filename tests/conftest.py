@@ -0,0 +1,26 @@
+import pytest
+
+from distributions import Exponential
+from replications import DEFAULT_CONFIG
+
+
+@pytest.fixture
+def busy_config():
+    """A short run at about 83% of its 30 slots, with two backlog places per server."""
+    return {
+        **DEFAULT_CONFIG,
+        'arrival_rate': 25.0,
+        'request_size_dist': Exponential(1.0),
+        'max_queue': 2,
+        'duration': 100,
+    }
+
+
+def without_timing(summary):
+    return {k: v for k, v in summary.items() if k != 'events_per_second'}
+
+
+@pytest.fixture
+def comparable():
+    """Drop wall-clock fields, so summaries of identical runs compare equal."""
+    return without_timing
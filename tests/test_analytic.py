@@ -0,0 +1,28 @@
+import pytest
+
+from analytic import check, estimate
+
+
+class Replay:
+    """Stands in for a trace replay: a source with ``next()``, not a distribution."""
+
+    def next(self):
+        return 1.0
+
+
+def test_unmodelled_algorithm_is_none_before_inputs_are_read():
+    assert estimate({'algorithm': 'ewma', 'arrival_rate': Replay()}) is None
+    assert estimate({'algorithm': 'trace', 'request_size_dist': Replay()}) is None
+
+
+def test_stream_inputs_are_none():
+    assert estimate({'algorithm': 'round_robin', 'arrival_rate': Replay()}) is None
+    assert estimate({'algorithm': 'least_connections', 'request_size_dist': Replay()}) is None
+    with pytest.raises(ValueError):
+        check({'algorithm': 'round_robin', 'arrival_rate': Replay()}, {})
+
+
+def test_distribution_inputs_are_modelled(busy_config):
+    expected = estimate(busy_config)
+    assert expected['model'] == "M/G/K/K+B per server"
+    assert 0 < expected['drop_rate'] < 1
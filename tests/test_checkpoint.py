@@ -0,0 +1,52 @@
+import pytest
+
+import checkpoint
+from distributions import Exponential
+from replications import DEFAULT_CONFIG, build_simulation, run_replication, simulate, summarize
+
+
+@pytest.fixture
+def uninterrupted(busy_config, comparable):
+    return comparable(summarize(simulate(busy_config, 3)))
+
+
+def test_run_checkpointed_matches_uninterrupted(tmp_path, busy_config, comparable, uninterrupted):
+    sim = checkpoint.run_checkpointed(build_simulation(busy_config, 3), busy_config['duration'],
+                                      tmp_path / "run.ck", every=7)
+    assert comparable(summarize(sim)) == uninterrupted
+
+
+def test_resume_from_saved_checkpoint(tmp_path, busy_config, comparable, uninterrupted):
+    path = tmp_path / "run.ck"
+    sim = build_simulation(busy_config, 3)
+    sim.start(busy_config['duration'])
+    sim.run_until(40)
+    checkpoint.save(sim, path)
+    del sim
+    resumed = checkpoint.run_checkpointed(None, busy_config['duration'], path, every=25)
+    assert comparable(summarize(resumed)) == uninterrupted
+
+
+def test_unforked_variant_replays_the_same_future(busy_config, comparable):
+    sim = build_simulation(busy_config, 3)
+    sim.start(busy_config['duration'])
+    sim.run_until(30)
+    snapshot = checkpoint.dumps(sim)
+    first, second = checkpoint.fork_variants(snapshot, [{}, {}], busy_config['duration'])
+    assert comparable(first) == comparable(second)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_warm_up_with_requests_in_flight(seed):
+    # Five-second services at 50 req/s: hundreds are in flight when the
+    # warm-up resets the statistics
+    config = {**DEFAULT_CONFIG, 'arrival_rate': 50.0, 'request_size_dist': Exponential(0.2),
+              'num_servers': 2, 'capacity': 1000, 'warmup': 5, 'duration': 40}
+    summary = run_replication(config, seed)
+    assert summary['dropped_requests'] == 0
+    assert summary['total_requests'] == pytest.approx(50 * 35, rel=0.1)
+
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        checkpoint.loads(b"not a checkpoint")
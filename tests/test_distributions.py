@@ -0,0 +1,59 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from distributions import Empirical, Exponential, LogNormal, Pareto, Stream, Uniform
+
+N = 200_000
+
+
+@pytest.mark.parametrize("dist", [
+    Exponential(2.0),
+    Uniform(1.0, 3.0),
+    LogNormal(0.0, 0.5),
+    Pareto(5.0, 2.0),
+    Empirical([1.0, 2.0, 10.0], weights=[3, 1, 1]),
+])
+def test_sample_mean_and_scv(dist):
+    values = dist.sample(np.random.default_rng(0), N)
+    mean = values.mean()
+    assert mean == pytest.approx(dist.mean(), rel=0.02)
+    assert values.var() / mean ** 2 == pytest.approx(dist.scv(), rel=0.05)
+
+
+def test_antithetic_draws_mirror_the_plain_ones():
+    plain = Uniform().sample(np.random.default_rng(1), 1000)
+    mirror = Uniform().sample(np.random.default_rng(1), 1000, antithetic=True)
+    np.testing.assert_allclose(plain + mirror, 1.0)
+
+    plain = LogNormal(1.0, 0.3).sample(np.random.default_rng(1), 1000)
+    mirror = LogNormal(1.0, 0.3).sample(np.random.default_rng(1), 1000, antithetic=True)
+    np.testing.assert_allclose(np.log(plain) + np.log(mirror), 2.0)
+
+
+@pytest.mark.parametrize("dist", [Exponential(1.0), Pareto(3.0), Empirical([1, 2, 3, 50])])
+def test_antithetic_pairs_are_negatively_correlated(dist):
+    plain = dist.sample(np.random.default_rng(2), N)
+    mirror = dist.sample(np.random.default_rng(2), N, antithetic=True)
+    assert np.isfinite(mirror).all()
+    assert np.corrcoef(plain, mirror)[0, 1] < -0.2
+    # Averaging a pair keeps the mean but shrinks the variance
+    assert ((plain + mirror) / 2).mean() == pytest.approx(dist.mean(), rel=0.02)
+    assert ((plain + mirror) / 2).var() < plain.var() / 2
+
+
+def test_stream_matches_block_sampling():
+    stream = Stream(Exponential(3.0), seed=5, block_size=64)
+    drawn = [stream.next() for _ in range(200)]
+    rng = np.random.default_rng(5)
+    expected = np.concatenate([Exponential(3.0).sample(rng, 64) for _ in range(4)])[:200]
+    np.testing.assert_allclose(drawn, expected)
+
+
+def test_stream_pickles_mid_block():
+    stream = Stream(Exponential(3.0), seed=5, block_size=64)
+    for _ in range(100):
+        stream.next()
+    copy = pickle.loads(pickle.dumps(stream))
+    assert [copy.next() for _ in range(100)] == [stream.next() for _ in range(100)]
@@ -0,0 +1,21 @@
+from replications import build_simulation
+
+
+def test_full_servers_are_not_failures(busy_config):
+    sim = build_simulation({**busy_config, 'arrival_rate': 60.0}, seed=1)
+    health = sim.enable_health_checks(max_fails=1)
+    sim.start(busy_config['duration'])
+    sim.run_until(busy_config['duration'])
+    assert sim.stats['dropped_requests'] > 0
+    assert sim.stats['failed_attempts'] == 0
+    assert health.marked_down == 0
+
+
+def test_down_server_fails_passively(busy_config):
+    sim = build_simulation(busy_config, seed=1)
+    health = sim.enable_health_checks(max_fails=1, fail_timeout=5.0)
+    health.schedule_outage(sim.servers[0].server_id, 10.0, 20.0)
+    sim.start(busy_config['duration'])
+    sim.run_until(busy_config['duration'])
+    assert sim.stats['failed_attempts'] > 0
+    assert health.marked_down >= 1
@@ -0,0 +1,49 @@
+import json
+import random
+
+import pytest
+
+from histogram import LatencyHistogram
+
+
+def filled(values):
+    hist = LatencyHistogram()
+    for value in values:
+        hist.record(value)
+    return hist
+
+
+def test_percentiles_within_relative_error():
+    rng = random.Random(2)
+    values = sorted(rng.lognormvariate(0, 1.5) for _ in range(20000))
+    hist = filled(values)
+    for q in (50, 90, 99, 99.9):
+        exact = values[int(q / 100 * len(values)) - 1]
+        assert hist.percentile(q) == pytest.approx(exact, rel=2 ** -hist.sub_bucket_bits * 2)
+    assert hist.max == values[-1]
+    assert hist.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_merge_equals_recording_everything():
+    rng = random.Random(3)
+    a = [rng.expovariate(10) for _ in range(5000)]
+    b = [rng.expovariate(0.1) for _ in range(3000)]
+    merged = filled(a).merge(filled(b))
+    whole = filled(a + b)
+    assert merged.counts == whole.counts
+    assert (merged.count, merged.min, merged.max) == (whole.count, whole.min, whole.max)
+    assert merged.total == pytest.approx(whole.total)
+    assert merged.summary() == pytest.approx(whole.summary())
+
+
+def test_merge_rejects_other_layouts():
+    with pytest.raises(ValueError):
+        LatencyHistogram().merge(LatencyHistogram(sub_bucket_bits=5))
+
+
+@pytest.mark.parametrize("values", [[], [0.0, 1e-9, 0.25, 3.0, 3.0, 1e4]])
+def test_dict_round_trip_through_json(values):
+    hist = filled(values)
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(hist.to_dict())))
+    assert restored.to_dict() == hist.to_dict()
+    assert restored.summary() == hist.summary()
@@ -0,0 +1,37 @@
+from replications import build_simulation
+
+
+def test_survives_warm_up_and_algorithm_switch(busy_config):
+    sim = build_simulation(busy_config, seed=2)
+    instrumentation = sim.instrument()
+    sim.warm_up(busy_config['duration'], 20)
+    recorded = instrumentation.calls['stats.record']
+    selected = instrumentation.calls['select_server']
+    sim.set_algorithm('least_connections')
+    sim.reseed(7)
+    sim.run_until(busy_config['duration'])
+    assert instrumentation.calls['stats.record'] - recorded == sim.latency.count
+    assert instrumentation.calls['select_server'] - selected >= sim.stats['total_requests']
+
+
+def test_attach_after_start(busy_config):
+    sim = build_simulation(busy_config, seed=2)
+    sim.start(busy_config['duration'])
+    sim.run_until(10)
+    instrumentation = sim.instrument()
+    sim.run_until(busy_config['duration'])
+    assert instrumentation.calls['request_arrival'] > 0
+    assert instrumentation.calls['request_completion'] > 0
+
+
+def test_detach_restores_the_originals(busy_config):
+    sim = build_simulation(busy_config, seed=2)
+    instrumentation = sim.instrument()
+    sim.start(busy_config['duration'])
+    sim.reset_stats()
+    instrumentation.detach()
+    assert sim.select_server == sim.strategy.select
+    assert 'record' not in vars(sim.latency)
+    assert 'next' not in vars(sim.interarrivals)
+    sim.run_until(busy_config['duration'])
+    assert instrumentation.calls['request_arrival'] == 0
@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+from replications import (build_simulation, confidence_interval, precise_enough, run_paired,
+                          run_replications, t_quantile)
+
+
+@pytest.mark.parametrize("df, expected", [
+    (1, 12.706), (2, 4.303), (3, 3.182), (5, 2.571), (10, 2.228), (30, 2.042),
+])
+def test_t_quantile_matches_tables(df, expected):
+    assert t_quantile(0.975, df) == pytest.approx(expected, rel=0.01)
+
+
+def test_confidence_interval_uses_the_t_distribution():
+    mean, half = confidence_interval([1.0, 2.0, 3.0, 4.0, 5.0])
+    assert mean == 3.0
+    assert half == pytest.approx(2.776 * math.sqrt(2.5) / math.sqrt(5), rel=0.005)
+    assert confidence_interval([4.0]) == (4.0, math.inf)
+
+
+def test_precise_enough():
+    assert precise_enough([10.0, 10.1, 9.9, 10.0], 0.05, 0.95)
+    assert not precise_enough([1.0, 10.0, 5.0], 0.05, 0.95)
+    assert precise_enough([0.0, 0.0, 0.0], 0.05, 0.95)
+
+
+def test_early_stop_at_the_first_precise_batch(busy_config):
+    merged = run_replications(busy_config, replications=8, seed=1, rel_precision=0.5,
+                              min_replications=3, workers=1)
+    assert merged['replications'] == 3
+    half = merged['mean_response_time']['half_width']
+    assert half <= 0.5 * merged['mean_response_time']['mean']
+
+
+def test_runs_every_replication_when_never_precise(busy_config):
+    merged = run_replications(busy_config, replications=4, seed=1, rel_precision=1e-9, workers=2)
+    assert merged['replications'] == 4
+
+
+@pytest.mark.parametrize("algorithm", ['least_connections', 'two_choices', 'consistent_hash', 'ewma'])
+def test_common_random_numbers_across_strategies(busy_config, algorithm):
+    # Randomised strategies draw from their own stream, so arrivals and
+    # service times stay aligned with round-robin's
+    base = build_simulation(busy_config, seed=[9, 0])
+    other = build_simulation({**busy_config, 'algorithm': algorithm}, seed=[9, 0])
+    for sim in (base, other):
+        sim.run_simulation(busy_config['duration'])
+    assert other.stats['total_requests'] == base.stats['total_requests']
+    assert other.interarrivals.next() == base.interarrivals.next()
+    assert other.service_times.next() == base.service_times.next()
+
+
+def test_paired_differences_of_identical_runs_are_zero(busy_config):
+    report = run_paired(busy_config, ['round_robin', 'round_robin'], replications=3, seed=4, workers=1)
+    for difference in report['differences']['round_robin'].values():
+        assert difference['mean'] == 0.0
+        assert difference['half_width'] == 0.0
@@ -0,0 +1,34 @@
+import random
+
+from replications import run_replication
+from scheduler import CalendarQueue, HeapScheduler
+
+
+def test_calendar_queue_pops_in_heap_order():
+    rng = random.Random(1)
+    heap, calendar = HeapScheduler(), CalendarQueue()
+    now, seq, popped = 0.0, 0, ([], [])
+    # A hold model with bursts, so the calendar resizes both ways
+    for step in range(20000):
+        burst = 50 if step % 2000 < 10 else 1
+        for _ in range(burst):
+            event = (now + rng.expovariate(1.0), seq, 0, seq, None, now)
+            seq += 1
+            heap.push(event)
+            calendar.push(event)
+        for _ in range(burst if step % 2000 >= 1000 else 1):
+            if not heap:
+                break
+            assert calendar.peek_time() == heap.peek_time()
+            popped[0].append(heap.pop())
+            popped[1].append(calendar.pop())
+            now = popped[0][-1][0]
+    assert popped[0] == popped[1]
+    assert len(heap) == len(calendar)
+
+
+def test_schedulers_give_identical_runs(busy_config, comparable):
+    config = {**busy_config, 'algorithm': 'least_connections'}
+    heap = run_replication({**config, 'scheduler': 'heap'}, 7)
+    calendar = run_replication({**config, 'scheduler': 'calendar'}, 7)
+    assert comparable(heap) == comparable(calendar)
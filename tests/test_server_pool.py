@@ -0,0 +1,50 @@
+import random
+
+from distributions import Exponential
+from lb_sim import BackendServer
+from server_pool import ServerPool
+
+
+def check_invariants(pool):
+    healthy = [s for s in pool.servers if s.is_healthy]
+    assert sorted(pool.healthy, key=id) == sorted(healthy, key=id)
+    assert pool._healthy_pos == {s: i for i, s in enumerate(pool.healthy)}
+    for load, bucket in enumerate(pool._buckets):
+        assert all(s.current_load == load and s.is_healthy for s in bucket)
+    assert sum(len(bucket) for bucket in pool._buckets) == len(healthy)
+    least = pool.least_loaded()
+    if healthy:
+        assert least.current_load == min(s.current_load for s in healthy)
+    else:
+        assert least is None
+
+
+def test_indexes_stay_consistent():
+    rng = random.Random(4)
+    servers = [BackendServer(f"s{i}", 10, Exponential(1.0)) for i in range(8)]
+    pool = ServerPool(servers)
+    assert pool.get("s3") is servers[3]
+    check_invariants(pool)
+    for _ in range(20000):
+        server = rng.choice(servers)
+        action = rng.random()
+        if action < 0.45:
+            pool.acquire(server)
+        elif action < 0.9:
+            if server.current_load:
+                pool.release(server)
+        else:
+            pool.set_healthy(server, not server.is_healthy)
+        check_invariants(pool)
+
+
+def test_on_change_sees_every_change():
+    servers = [BackendServer(f"s{i}", 10, Exponential(1.0)) for i in range(2)]
+    pool = ServerPool(servers)
+    changed = []
+    pool.on_change = changed.append
+    pool.acquire(servers[0])
+    pool.set_healthy(servers[1], False)
+    pool.set_healthy(servers[1], False)  # no change
+    pool.release(servers[0])
+    assert changed == [servers[0], servers[1], servers[0]]
@@ -0,0 +1,10 @@
+from sharded import run_sharded
+
+
+def test_results_do_not_depend_on_workers(busy_config):
+    config = {**busy_config, 'duration': 20}
+    runs = [run_sharded(config, shards=3, workers=workers, seed=5, window=0.05)
+            for workers in (1, 2, 3)]
+    assert runs[0]['stats']['total_requests'] > 0
+    assert runs[1] == runs[0]
+    assert runs[2] == runs[0]
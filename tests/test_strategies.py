@@ -0,0 +1,22 @@
+from replications import build_simulation
+
+
+def test_consistent_hash_retry_keeps_the_key(busy_config):
+    sim = build_simulation({**busy_config, 'algorithm': 'consistent_hash', 'num_servers': 5}, seed=3)
+    strategy = sim.strategy
+    first = strategy.select()
+    drawn = strategy.clients._pos
+    tried = [first]
+    for _ in range(4):
+        # The next distinct server clockwise, without drawing another client
+        position = strategy._position
+        ring = strategy.ring
+        expected = next(ring[(position + k) % len(ring)] for k in range(1, len(ring))
+                        if ring[(position + k) % len(ring)] not in tried)
+        server = strategy.retry(tried)
+        assert server is expected
+        tried.append(server)
+    assert strategy.clients._pos == drawn
+    assert sorted(s.server_id for s in tried) == sorted(s.server_id for s in sim.servers)
+    assert strategy.retry(tried) is None
+
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from distributions import Empirical, Exponential
+from sweep import cache_key
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+
+def test_different_distributions_give_different_keys():
+    keys = {cache_key({'request_size_dist': dist}, [0, 0], "v")
+            for dist in (Exponential(1.0), Exponential(5.0), Empirical([1, 2]), Empirical([1, 2], [3, 1]))}
+    assert len(keys) == 4
+
+
+def test_equal_distributions_give_equal_keys():
+    assert (cache_key({'request_size_dist': Exponential(2.0)}, [0, 1], "v")
+            == cache_key({'request_size_dist': Exponential(2.0)}, [0, 1], "v"))
+
+
+def test_key_is_the_same_in_another_process():
+    config = {'arrival_rate': Exponential(3.0), 'request_size_dist': Empirical([1.0, 4.0])}
+    code = ("from distributions import Empirical, Exponential; from sweep import cache_key; "
+            "print(cache_key({'arrival_rate': Exponential(3.0), "
+            "'request_size_dist': Empirical([1.0, 4.0])}, [0, 1], 'v'))")
+    env = {**os.environ, 'PYTHONPATH': str(SRC)}
+    other = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert other.stdout.strip() == cache_key(config, [0, 1], "v")
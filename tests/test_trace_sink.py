@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+import pytest
+
+from replications import build_simulation
+from trace_sink import TraceReader
+
+
+def traced_run(config, directory, **kwargs):
+    sim = build_simulation({**config, 'queue_timeout': 0.5}, seed=6)
+    with sim.trace_requests(directory, chunk_rows=256, **kwargs) as sink:
+        sim.run_simulation(config['duration'])
+    return sim, sink
+
+
+@pytest.mark.parametrize("format", ['npy', 'parquet'])
+def test_one_row_per_request(busy_config, tmp_path, format):
+    if format == 'parquet':
+        pytest.importorskip("pyarrow")
+    sim, sink = traced_run(busy_config, tmp_path, format=format)
+    reader = TraceReader(tmp_path)
+    waiting = sum(len(server.queue) for server in sim.servers)
+    assert len(reader) == sink.rows == sim.stats['total_requests'] - waiting
+    if format == 'npy':
+        assert sink.chunks == math.ceil(sink.rows / 256)
+
+    ids = reader.column('request_id')
+    assert len(np.unique(ids)) == len(ids)
+    dropped = reader.column('dropped')
+    assert dropped.sum() == sim.stats['dropped_requests']
+
+    served = ~dropped
+    start, finish = reader.column('start'), reader.column('finish')
+    assert (start[served] >= reader.column('arrival')[served]).all()
+    assert (finish[served] > start[served]).all()
+    assert np.isnan(start[dropped]).all() and np.isnan(finish[dropped]).all()
+    server = reader.column('server')
+    assert ((server[served] >= 0) & (server[served] < len(reader.servers))).all()
+    # Timed-out requests keep the server whose backlog they waited in
+    assert (server[dropped] >= 0).sum() == sim.stats['timed_out_requests']
+
+
+def test_unknown_format(busy_config, tmp_path):
+    sim = build_simulation(busy_config, seed=6)
+    with pytest.raises(ValueError):
+        sim.trace_requests(tmp_path, format='csv')
@@ -0,0 +1,46 @@
+from main import TrafficGenerator
+
+
+class Constant:
+    """A stream that always returns the same value."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def next(self):
+        return self.value
+
+
+def one_slot(queue_timeout):
+    # Arrivals every 1.5 s on one slot that stays busy, with one backlog place
+    return TrafficGenerator(arrival_rate_dist=Constant(1.5), request_size_dist=Constant(10.0),
+                            num_servers=1, capacity=1, max_queue=1, queue_timeout=queue_timeout)
+
+
+def test_expired_requests_free_the_backlog():
+    sim = one_slot(1.0)
+    sim.run_simulation(8.0)
+    # Each arrival finds the previous one expired and takes its place
+    assert sim.stats['total_requests'] == 5
+    assert sim.stats['queued_requests'] == 4
+    assert sim.stats['timed_out_requests'] == 3
+    assert sim.stats['dropped_requests'] == 3
+    server = sim.servers[0]
+    assert len(server.queue) == 1
+    assert server.current_load == 2
+
+
+def test_leftovers_time_out_at_the_end_of_the_run():
+    sim = one_slot(1.0)
+    sim.run_simulation(9.0)
+    assert sim.stats['timed_out_requests'] == 4
+    assert not sim.servers[0].queue
+    assert sim.servers[0].current_load == 1
+
+
+def test_without_timeout_the_backlog_stays_full():
+    sim = one_slot(None)
+    sim.run_simulation(8.0)
+    assert sim.stats['queued_requests'] == 1
+    assert sim.stats['timed_out_requests'] == 0
+    assert sim.stats['dropped_requests'] == 3